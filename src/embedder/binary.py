@@ -0,0 +1,287 @@
+# AUTHOR Andrej Bartulin
+# PROJECT: B.A.G.E.R. parser
+# LICENSE: Polyform Shield License 1.0.0
+# DESCRIPTION: Binary output format
+
+import numpy as np
+import shapely
+import struct
+
+# File starts with a header, followed by any number of section records
+MAGIC = b"BAGR"
+VERSION = 1
+
+HEADER = struct.Struct("<4sHH")          # magic, version, reserved
+SECTION_LENGTH = struct.Struct("<I")     # length of the section body
+SECTION_INFO = struct.Struct("<BBdI")    # flags, encoding, resolution, polygon count
+
+# Section flags
+FLAG_HOLE = 0x01
+
+# Coordinate encodings
+ENCODING_INT32 = 0
+ENCODING_DELTA = 1
+
+ENCODINGS = {
+    "int32": ENCODING_INT32,
+    "delta": ENCODING_DELTA,
+}
+
+def encode_header():
+    """
+        Encode the file header.
+    """
+
+    return HEADER.pack(MAGIC, VERSION, 0)
+
+def encode_section(name, hole, divided_polygons, encoding="delta", resolution=0.01):
+    """
+        Encode a section and its divided polygons into a section record.
+
+        Coordinates are stored as fixed-point integers (`resolution` units per
+        step), either as plain int32 triplets or as zigzag varint deltas from
+        the previous vertex of the same ring.
+
+        :param str name: name of the section
+        :param bool hole: are polygons place to dig or dump soil
+        :param list divided_polygons: list of cells FOR EACH polygon
+        :param str encoding: `int32` or `delta`
+        :param float resolution: size of one fixed-point step
+    """
+
+    if encoding not in ENCODINGS:
+        raise ValueError(f"[EMBEDDER-BINARY] Unknown coordinate encoding '{encoding}'!")
+
+    cells = [cell for cells in divided_polygons for cell in cells]
+
+    # All rings of all cells at once, closing vertex is not stored
+    rings, cell_index = shapely.get_rings(cells, return_index=True)
+    coords, ring_index = shapely.get_coordinates(rings, include_z=True, return_index=True)
+
+    ring_lengths = np.bincount(ring_index, minlength=len(rings))
+    keep = np.ones(len(coords), dtype=bool)
+    keep[np.cumsum(ring_lengths) - 1] = False
+
+    coords = np.nan_to_num(coords[keep])
+    ring_index = ring_index[keep]
+    ring_lengths -= 1
+
+    quantized = np.rint(coords / resolution)
+    if np.any(np.abs(quantized) > np.iinfo(np.int32).max):
+        raise ValueError("[EMBEDDER-BINARY] Coordinates do not fit into int32," +
+                         " increase `binary_resolution`.")
+
+    quantized = quantized.astype(np.int64)
+
+    # Encode coordinates of every ring into its own block of bytes
+    if ENCODINGS[encoding] == ENCODING_INT32:
+        data = quantized.astype("<i4").tobytes()
+        block_lengths = ring_lengths * 12
+
+    else:
+        deltas = quantized.copy()
+        first = np.cumsum(ring_lengths) - ring_lengths
+        deltas[1:] -= quantized[:-1]
+        deltas[first[ring_lengths > 0]] = quantized[first[ring_lengths > 0]]
+
+        values = deltas.reshape(-1)
+        data, lengths = encode_varints((values << 1) ^ (values >> 63))
+
+        value_ring = np.repeat(ring_index, 3)
+        block_lengths = np.bincount(value_ring, weights=lengths, minlength=len(rings)).astype(np.int64)
+
+    block_ends = np.cumsum(block_lengths)
+    block_starts = block_ends - block_lengths
+
+    # Assemble the section body
+    encoded_name = name.encode("utf-8")
+    body = [struct.pack("<H", len(encoded_name)), encoded_name,
+            SECTION_INFO.pack(FLAG_HOLE if hole else 0, ENCODINGS[encoding],
+                              resolution, len(divided_polygons))]
+
+    rings_per_cell = np.bincount(cell_index, minlength=len(cells))
+    first_ring = np.cumsum(rings_per_cell) - rings_per_cell
+
+    cell = 0
+    for polygon_cells in divided_polygons:
+        body.append(struct.pack("<I", len(polygon_cells)))
+
+        for _ in polygon_cells:
+            body.append(struct.pack("<H", rings_per_cell[cell]))
+
+            for ring in range(first_ring[cell], first_ring[cell] + rings_per_cell[cell]):
+                body.append(struct.pack("<I", ring_lengths[ring]))
+                body.append(data[block_starts[ring]:block_ends[ring]])
+
+            cell += 1
+
+    body = b"".join(body)
+    return SECTION_LENGTH.pack(len(body)) + body
+
+def encode_varints(values):
+    """
+        INTERNAL FUNCTION!
+
+        Encode unsigned integers as LEB128 varints.
+        Returns encoded bytes and number of bytes of every value.
+    """
+
+    values = values.astype(np.uint64)
+
+    lengths = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while np.any(rest):
+        lengths += rest > 0
+        rest >>= np.uint64(7)
+
+    out = np.empty(int(lengths.sum()), dtype=np.uint8)
+    starts = np.cumsum(lengths) - lengths
+
+    rest = values.copy()
+    for i in range(int(lengths.max(initial=0))):
+        active = lengths > i
+        more = (lengths[active] > i + 1).astype(np.uint8) << 7
+
+        out[starts[active] + i] = (rest[active] & np.uint64(0x7F)).astype(np.uint8) | more
+        rest[active] >>= np.uint64(7)
+
+    return (out.tobytes(), lengths)
+
+def read_records(file):
+    """
+        Yield name and raw bytes (length prefix included) of every section
+        record of an opened binary file, one record at a time.
+
+        :param file file: binary file opened for reading, positioned at its start
+    """
+
+    header = file.read(HEADER.size)
+    if len(header) == 0:
+        return
+
+    if len(header) < HEADER.size or HEADER.unpack(header)[0] != MAGIC:
+        raise ValueError("[EMBEDDER-BINARY] Not a B.A.G.E.R. binary file!")
+
+    while True:
+        prefix = file.read(SECTION_LENGTH.size)
+        if len(prefix) < SECTION_LENGTH.size:
+            return
+
+        (length,) = SECTION_LENGTH.unpack(prefix)
+        body = file.read(length)
+
+        (name_length,) = struct.unpack_from("<H", body, 0)
+        yield (body[2:2 + name_length].decode("utf-8"), prefix + body)
+
+###########################################################################
+#####                                                                 #####
+###########################################################################
+
+def decode(data):
+    """
+        Reference decoder, decode a whole binary file.
+
+        Returns a list of sections, every section is a dictionary with `name`,
+        `hole` and `polygons` keys. `polygons` holds a list of cells FOR EACH
+        polygon, every cell is a list of rings and every ring a list of
+        (x, y, z) tuples without the closing vertex.
+
+        :param bytes data: contents of the binary file
+    """
+
+    magic, version, _ = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("[EMBEDDER-BINARY] Not a B.A.G.E.R. binary file!")
+
+    if version != VERSION:
+        raise ValueError(f"[EMBEDDER-BINARY] Unsupported version {version}!")
+
+    sections = []
+    offset = HEADER.size
+    while offset < len(data):
+        (length,) = SECTION_LENGTH.unpack_from(data, offset)
+        offset += SECTION_LENGTH.size
+
+        sections.append(decode_section(data[offset:offset + length]))
+        offset += length
+
+    return sections
+
+def decode_section(body):
+    """
+        Reference decoder, decode body of a single section record.
+
+        :param bytes body: section body without the length prefix
+    """
+
+    (name_length,) = struct.unpack_from("<H", body, 0)
+    offset = 2
+    name = body[offset:offset + name_length].decode("utf-8")
+    offset += name_length
+
+    flags, encoding, resolution, polygon_count = SECTION_INFO.unpack_from(body, offset)
+    offset += SECTION_INFO.size
+
+    polygons = []
+    for _ in range(polygon_count):
+        (cell_count,) = struct.unpack_from("<I", body, offset)
+        offset += 4
+
+        cells = []
+        for _ in range(cell_count):
+            (ring_count,) = struct.unpack_from("<H", body, offset)
+            offset += 2
+
+            rings = []
+            for _ in range(ring_count):
+                (vertex_count,) = struct.unpack_from("<I", body, offset)
+                offset += 4
+
+                ring = []
+                previous = (0, 0, 0)
+                for _ in range(vertex_count):
+                    if encoding == ENCODING_INT32:
+                        vertex = struct.unpack_from("<iii", body, offset)
+                        offset += 12
+
+                    else:
+                        vertex = []
+                        for axis in range(3):
+                            value, offset = decode_varint(body, offset)
+                            vertex.append(previous[axis] + ((value >> 1) ^ -(value & 1)))
+
+                        vertex = tuple(vertex)
+                        previous = vertex
+
+                    ring.append(tuple(value * resolution for value in vertex))
+
+                rings.append(ring)
+
+            cells.append(rings)
+
+        polygons.append(cells)
+
+    return {
+        "name": name,
+        "hole": bool(flags & FLAG_HOLE),
+        "polygons": polygons,
+    }
+
+def decode_varint(data, offset):
+    """
+        INTERNAL FUNCTION!
+
+        Decode a LEB128 varint, returns its value and offset after it.
+    """
+
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+
+        value |= (byte & 0x7F) << shift
+        shift += 7
+
+        if byte & 0x80 == 0:
+            return (value, offset)
@@ -5,9 +5,17 @@
 
 import math
 import matplotlib.pyplot as plt
+import numpy as np
+import os
+import shapely
+import tempfile
 from shapely.geometry import LineString, MultiPolygon, Polygon
 from shapely.ops import split
 
+from embedder.binary import encode_header, encode_section, read_records
+from embedder.index import replace_file
+from embedder.writer import DocumentationWriter
+
 class Embedder:
     """
         Embed divided polygons into a file which will is going to be
@@ -30,11 +38,27 @@ class Embedder:
         self.parsed_toml = parsed_toml
         self.section_name: str = section_name
 
-        self.text = ""
-
         self.debug = False
         self.divided_polygons = []
 
+        # How polygons are divided into cells, `split` cuts a polygon with
+        # every line in turn while `band` clips it to the bands between
+        # parallel lines in one pass
+        self.split_mode = self.parsed_toml[self.section_name].get('split_mode', 'split')
+        if self.split_mode not in ("split", "band"):
+            print(f"[EMBEDDER] Unknown split mode '{self.split_mode}'!" +
+                  " Defaulting to `split`.")
+
+            self.split_mode = "split"
+
+        # Is the section written as text or in the binary format
+        self.output_format = self.parsed_toml[self.section_name].get('output_format', 'text')
+        if self.output_format not in ("text", "binary"):
+            print(f"[EMBEDDER] Unknown output format '{self.output_format}'!" +
+                  " Defaulting to `text`.")
+
+            self.output_format = "text"
+
     def execute(self):
         """
             Embed.
@@ -51,33 +75,105 @@ class Embedder:
                 
                 print("[EMBEDDER-DEBUG] ----------------------------------------")
         
-        self.polygonize()
+        if self.output_format == "binary":
+            self.polygonize()
+            self.write_binary()
 
-        self.text += self.section_name.upper()
-        self.text += "-"
-        self.text += str(self.parsed_toml[self.section_name]['hole']).upper()
-        self.text += "\n"
+        else:
+            self.write_text()
 
-        for i in range(len(self.divided_polygons)):
-            if self.debug == True:
-                print(f"[EMBEDDER-DEBUG] --- POLYGON {i} ---: ")
+    ###########################################################################
+    #####                                                                 #####
+    ###########################################################################
 
-            self.text += f"\tPOLYGON {i}\n"
+    def write_binary(self):
+        """
+            Write divided polygons to `documentation.bin` in the binary format,
+            replacing an older section with the same name.
+        """
+
+        name = self.section_name.upper()
+        section = self.parsed_toml[self.section_name]
+        record = encode_section(name, section['hole'],
+                                self.divided_polygons,
+                                section.get('binary_encoding', 'delta'),
+                                section.get('binary_resolution', 0.01))
+
+        path = "documentation.bin"
+        directory = os.path.dirname(os.path.abspath(path))
+        descriptor, temp_path = tempfile.mkstemp(prefix=".documentation-", dir=directory)
+
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(encode_header())
+
+                # New section takes place of the first older section with
+                # the same name, other sections are copied as they are
+                written = False
+                if os.path.exists(path):
+                    with open(path, "rb") as source:
+                        for record_name, data in read_records(source):
+                            if record_name != name:
+                                file.write(data)
+
+                            elif written == False:
+                                file.write(record)
+                                written = True
+
+                if written == False:
+                    file.write(record)
+
+                file.flush()
+                os.fsync(file.fileno())
+
+            replace_file(temp_path, path)
+
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        print(f"[EMBEDDER] Written {len(record)} bytes of section" +
+              f" {name} to {path}.")
+
+    def write_text(self):
+        """
+            Divide polygons and stream them into `documentation.txt`,
+            replacing an older section with the same name.
+        """
+
+        name = self.section_name.upper()
+        hole = self.parsed_toml[self.section_name]['hole']
+
+        writer = DocumentationWriter("documentation.txt")
+        writer.begin_section(name, hole)
+
+        try:
+            cells = 0
+            for i, (polygon, division) in enumerate(zip(self.polygons, self.divisions)):
+                result = self.divide_polygon(polygon, division)
+                self.divided_polygons.append(result)
 
-            for polygon in self.divided_polygons[i]:
                 if self.debug == True:
-                    print(f"[EMBEDDER-DEBUG] \t{polygon}")
+                    print(f"[EMBEDDER-DEBUG] --- POLYGON {i} ---: ")
 
-                self.text += f"\t\t{polygon}\n"
+                writer.begin_polygon(i)
+                for polygon in result:
+                    if self.debug == True:
+                        print(f"[EMBEDDER-DEBUG] \t{polygon}")
 
-        print("[EMBEDDER] " + self.text)
+                    writer.write_cell(polygon)
 
-        with open("documentation.txt", "a") as file:
-            file.write(self.text)
+                cells += len(result)
 
-    ###########################################################################
-    #####                                                                 #####
-    ###########################################################################
+            writer.end_section()
+
+        finally:
+            # Nothing is left to clean up if the section has been written
+            writer.abort()
+
+        print(f"[EMBEDDER] Written section {name}-{str(hole).upper()}" +
+              f" ({len(self.divided_polygons)} polygons, {cells} cells)" +
+              " to documentation.txt.")
 
     def polygonize(self):
         """
@@ -86,16 +182,86 @@ class Embedder:
         """
 
         for polygon, division in zip(self.polygons, self.divisions):
-            for i in range(len(division)):
-                division[i] = self.extend_line(division[i], polygon.bounds)
+            self.divided_polygons.append(self.divide_polygon(polygon, division))
+
+    def divide_polygon(self, polygon, division):
+        """
+            Split a polygon into smaller polygons based on its LineString divisions.
+        """
+
+        if self.split_mode == "band" and self.are_parallel(division):
+            return self.band_polygons(polygon, division)
 
-            result = self.split_polygons(polygon, division)
-            self.divided_polygons.append(result)
+        for i in range(len(division)):
+            division[i] = self.extend_line(division[i], polygon.bounds)
+
+        return self.split_polygons(polygon, division)
 
     ###########################################################################
     #####                                                                 #####
     ###########################################################################
 
+    def are_parallel(self, lines):
+        """
+            INTERNAL FUNCTION!
+
+            Check if all lines have the same direction.
+        """
+
+        if len(lines) == 0:
+            return True
+
+        coords = shapely.get_coordinates(lines)
+        direction = coords[1::2] - coords[0::2]
+        direction /= np.hypot(direction[:, 0], direction[:, 1])[:, None]
+
+        cross = direction[:, 0] * direction[0, 1] - direction[:, 1] * direction[0, 0]
+        return bool(np.all(np.abs(cross) <= 1e-9))
+
+    def band_polygons(self, polygon, lines):
+        """
+            INTERNAL FUNCTION!
+
+            Divide a polygon into cells between parallel LineString divisions.
+
+            Polygon is rotated so the lines are horizontal (Separator already
+            creates them that way) and intersected with all bands between
+            consecutive lines in one vectorized call.
+        """
+
+        if len(lines) == 0:
+            return [polygon]
+
+        coords = shapely.get_coordinates(lines)
+        dx, dy = coords[1] - coords[0]
+        angle = math.atan2(dy, dx)
+
+        if dy == 0:
+            frame = polygon
+            offsets = coords[0::2, 1]
+
+        else:
+            frame = self.rotate(polygon, -angle)
+            offsets = coords[0::2, 1] * math.cos(angle) - coords[0::2, 0] * math.sin(angle)
+
+        minx, miny, maxx, maxy = frame.bounds
+        cuts = np.unique(offsets)
+        cuts = cuts[(cuts > miny) & (cuts < maxy)]
+
+        # Lines closer than floating point noise would only leave slivers
+        tolerance = 1e-9 * max(1.0, maxy - miny)
+        cuts = cuts[np.diff(cuts, prepend=miny) > tolerance]
+        edges = np.concatenate(([miny], cuts, [maxy]))
+
+        bands = shapely.box(minx - 1.0, edges[:-1], maxx + 1.0, edges[1:])
+        cells = shapely.get_parts(shapely.intersection(frame, bands))
+        cells = cells[(shapely.get_type_id(cells) == 3) & (shapely.area(cells) > 0)]
+
+        if dy != 0:
+            cells = self.rotate(cells, angle)
+
+        return list(cells)
+
     def extend_line(self, line, bounds, extension=1.0):
         """
             INTERNAL FUNCTION!
@@ -124,6 +290,23 @@ class Embedder:
 
         return LineString([new_start, new_end])
 
+    def rotate(self, geometry, angle):
+        """
+            INTERNAL FUNCTION!
+
+            Rotate geometry around the origin, keeping Z coordinates.
+        """
+
+        cos, sin = math.cos(angle), math.sin(angle)
+
+        def rotate_coords(coords):
+            rotated = coords.copy()
+            rotated[:, 0] = coords[:, 0] * cos - coords[:, 1] * sin
+            rotated[:, 1] = coords[:, 0] * sin + coords[:, 1] * cos
+            return rotated
+
+        return shapely.transform(geometry, rotate_coords, include_z=True)
+
     def split_polygons(self, polygon, lines):
         """
             INTERNAL FUNCTION!
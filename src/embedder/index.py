@@ -0,0 +1,141 @@
+# AUTHOR Andrej Bartulin
+# PROJECT: B.A.G.E.R. parser
+# LICENSE: Polyform Shield License 1.0.0
+# DESCRIPTION: Sidecar index of documentation.txt
+
+import json
+import os
+import stat
+import tempfile
+
+def replace_file(temp_path, path):
+    """
+        Atomically replace `path` with a temporary file.
+
+        Temporary files are created readable only by their owner, so they get
+        permissions of the replaced file (or the default ones for a new file).
+
+        :param str temp_path: path to the temporary file
+        :param str path: path to the replaced file
+    """
+
+    if os.path.exists(path):
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+
+    else:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+
+    os.chmod(temp_path, mode)
+    os.replace(temp_path, path)
+
+class DocumentationIndex:
+    """
+        Byte offsets of sections and polygons in `documentation.txt`, kept
+        in a sidecar `.idx` file next to it.
+
+        Every section is a dictionary holding its `name`, `hole` value,
+        `start` and `end` offsets and `polygons`, a list of offsets of
+        `POLYGON i` lines.
+
+        :param str path: path to the documentation file
+    """
+
+    def __init__(self, path):
+        """
+            Initialize variables.
+        """
+
+        self.path = path
+        self.index_path = path + ".idx"
+
+    def load(self):
+        """
+            Load sections from the sidecar index, scan the documentation file
+            if the index is missing or out of date.
+
+            Scanned sections are not saved, so readers never write the index
+            (the file might be read-only or being replaced by a writer). The
+            writer saves the index together with every section it writes.
+        """
+
+        if not os.path.exists(self.path):
+            return []
+
+        info = os.stat(self.path)
+
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r") as file:
+                    index = json.load(file)
+
+                if index['size'] == info.st_size and index['mtime_ns'] == info.st_mtime_ns:
+                    return index['sections']
+
+            except (OSError, ValueError, KeyError):
+                pass
+
+        return self.scan()
+
+    def save(self, sections):
+        """
+            Atomically write the sidecar index for the current documentation file.
+        """
+
+        info = os.stat(self.path)
+        index = {
+            'size': info.st_size,
+            'mtime_ns': info.st_mtime_ns,
+            'sections': sections,
+        }
+
+        directory = os.path.dirname(os.path.abspath(self.index_path))
+        descriptor, temp_path = tempfile.mkstemp(prefix=".documentation-", dir=directory)
+        with os.fdopen(descriptor, "w") as file:
+            json.dump(index, file)
+
+        replace_file(temp_path, self.index_path)
+
+    ###########################################################################
+    #####                                                                 #####
+    ###########################################################################
+
+    def scan(self):
+        """
+            INTERNAL FUNCTION!
+
+            Find offsets of all sections and polygons by reading the file line
+            by line.
+        """
+
+        sections = []
+        offset = 0
+
+        with open(self.path, "rb") as file:
+            for line in file:
+                if line.strip() == b"":
+                    pass
+
+                elif not line.startswith(b"\t"):
+                    if len(sections) > 0:
+                        sections[-1]['end'] = offset
+
+                    name, _, hole = line.decode("utf-8").rstrip("\r\n").rpartition("-")
+                    sections.append({
+                        'name': name,
+                        'hole': hole,
+                        'start': offset,
+                        'end': 0,
+                        'polygons': [],
+                    })
+
+                elif line.startswith(b"\tPOLYGON ") and len(sections) > 0:
+                    sections[-1]['polygons'].append(offset)
+
+                offset += len(line)
+
+        if len(sections) > 0:
+            sections[-1]['end'] = offset
+
+        return sections
@@ -0,0 +1,129 @@
+# AUTHOR Andrej Bartulin
+# PROJECT: B.A.G.E.R. parser
+# LICENSE: Polyform Shield License 1.0.0
+# DESCRIPTION: Random-access reader for documentation.txt
+
+import mmap
+import os
+from shapely import wkt
+
+from embedder.index import DocumentationIndex
+
+class DocumentationReader:
+    """
+        Read cells of single polygons from `documentation.txt` without
+        loading the whole file.
+
+        File is memory-mapped and polygons are found through the sidecar
+        index (scanned in memory when missing or out of date), so only the
+        requested lines are touched.
+
+        :param str path: path to the documentation file
+    """
+
+    def __init__(self, path="documentation.txt"):
+        """
+            Initialize variables.
+        """
+
+        self.path = path
+
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"[READER] File in path '{path}' does not exist!")
+
+        self.sections = {}
+        for section in DocumentationIndex(path).load():
+            self.sections[f"{section['name']}-{section['hole']}"] = section
+
+        self.file = open(path, "rb")
+        self.map = None
+        if os.path.getsize(path) > 0:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        """
+            Unmap and close the documentation file.
+        """
+
+        if self.map != None:
+            self.map.close()
+            self.map = None
+
+        self.file.close()
+
+    def get_sections(self):
+        """
+            Return names of all sections, e.g. `HOLE-TRUE`.
+        """
+
+        return list(self.sections.keys())
+
+    def get_polygon_count(self, section):
+        """
+            Return number of polygons in a section.
+
+            :param str section: name of the section, e.g. `HOLE-TRUE`
+        """
+
+        return len(self.get_section(section)['polygons'])
+
+    def get_cells(self, key):
+        """
+            Return cells of a polygon addressed as `SECTION-HOLE/POLYGON i`,
+            e.g. `HOLE-TRUE/POLYGON 0`.
+        """
+
+        section, _, polygon = key.partition("/")
+        number = polygon.strip().removeprefix("POLYGON").strip()
+
+        if not number.isdigit():
+            raise KeyError(f"[READER] Invalid polygon key '{key}'!")
+
+        return list(self.iter_cells(section, int(number)))
+
+    def iter_cells(self, section, i):
+        """
+            Lazily yield cells (Shapely polygons) of polygon `i` in a section.
+
+            :param str section: name of the section, e.g. `HOLE-TRUE`
+            :param int i: index of the polygon
+        """
+
+        entry = self.get_section(section)
+        polygons = entry['polygons']
+
+        if i < 0 or i >= len(polygons):
+            raise IndexError(f"[READER] Section '{section}' has no polygon {i}!")
+
+        start = polygons[i]
+        end = polygons[i + 1] if i + 1 < len(polygons) else entry['end']
+
+        # Skip the `POLYGON i` line
+        position = self.map.find(b"\n", start, end) + 1
+
+        while 0 < position < end:
+            line_end = self.map.find(b"\n", position, end)
+            if line_end == -1:
+                line_end = end
+
+            line = self.map[position:line_end].strip()
+            if len(line) > 0:
+                yield wkt.loads(line.decode("utf-8"))
+
+            position = line_end + 1
+
+    ###########################################################################
+    #####                                                                 #####
+    ###########################################################################
+
+    def get_section(self, section):
+        """
+            INTERNAL FUNCTION!
+
+            Return index entry of a section.
+        """
+
+        if section not in self.sections:
+            raise KeyError(f"[READER] Section '{section}' does not exist!")
+
+        return self.sections[section]
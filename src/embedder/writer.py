@@ -0,0 +1,216 @@
+# AUTHOR Andrej Bartulin
+# PROJECT: B.A.G.E.R. parser
+# LICENSE: Polyform Shield License 1.0.0
+# DESCRIPTION: Streaming writer for documentation.txt
+
+import os
+import tempfile
+
+from embedder.index import DocumentationIndex, replace_file
+
+class DocumentationWriter:
+    """
+        Stream sections into `documentation.txt`.
+
+        A section replaces every older section with the same name instead of
+        being appended again. New contents are written into a temporary file
+        which atomically replaces the documentation file once the section is
+        complete. Byte offsets of sections and polygons are kept in a sidecar
+        index, so untouched parts of the file are copied without parsing.
+
+        :param str path: path to the documentation file
+    """
+
+    def __init__(self, path="documentation.txt"):
+        """
+            Initialize variables.
+        """
+
+        self.path = path
+        self.index = DocumentationIndex(path)
+
+        # List of sections, each holds name, hole, start, end and polygons
+        self.sections = self.index.load()
+
+        # State of the section being written
+        self.file = None
+        self.temp_path = ""
+        self.current = None
+        self.kept = []
+        self.position = 0
+        self.size = 0
+
+    def begin_section(self, name, hole):
+        """
+            Start writing a section.
+
+            :param str name: name of the section
+            :param bool hole: are polygons place to dig or dump soil
+        """
+
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+        # Older sections with the same name are dropped, new one takes
+        # place of the first of them
+        replaced = [section for section in self.sections if section['name'] == name]
+        self.kept = [section for section in self.sections if section['name'] != name]
+        position = replaced[0]['start'] if len(replaced) > 0 else size
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        descriptor, self.temp_path = tempfile.mkstemp(prefix=".documentation-", dir=directory)
+        self.file = os.fdopen(descriptor, "wb", buffering=1024 * 1024)
+
+        self.copy_ranges(self.ranges_between(0, position))
+
+        header = f"{name}-{str(hole).upper()}\n".encode("utf-8")
+        self.current = {
+            'name': name,
+            'hole': str(hole).upper(),
+            'start': self.file.tell(),
+            'end': 0,
+            'polygons': [],
+        }
+        self.file.write(header)
+
+        self.position = position
+        self.size = size
+
+    def begin_polygon(self, i):
+        """
+            Start writing cells of polygon `i` of the current section.
+        """
+
+        self.current['polygons'].append(self.file.tell())
+        self.file.write(f"\tPOLYGON {i}\n".encode("utf-8"))
+
+    def write_cell(self, cell):
+        """
+            Write a cell (divided polygon) of the current polygon.
+        """
+
+        self.file.write(f"\t\t{cell}\n".encode("utf-8"))
+
+    def end_section(self):
+        """
+            Finish the current section and atomically replace the documentation file.
+        """
+
+        self.current['end'] = self.file.tell()
+
+        # Copy everything after the section, shifting offsets
+        sections = []
+        for section in self.kept:
+            if section['start'] < self.position:
+                sections.append(section)
+
+        sections.append(self.current)
+
+        offset = self.current['end']
+        for start, end in self.ranges_between(self.position, self.size):
+            moved = offset - start
+            for section in self.kept:
+                if start <= section['start'] < end:
+                    sections.append(self.moved_section(section, moved))
+
+            offset += end - start
+
+        self.copy_ranges(self.ranges_between(self.position, self.size))
+
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        self.file = None
+
+        replace_file(self.temp_path, self.path)
+
+        self.sections = sections
+        self.index.save(sections)
+
+    def abort(self):
+        """
+            Throw away the current section, documentation file is left untouched.
+        """
+
+        if self.file != None:
+            self.file.close()
+            self.file = None
+
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+    def get_sections(self):
+        """
+            Return index of all sections.
+        """
+
+        return self.sections
+
+    ###########################################################################
+    #####                                                                 #####
+    ###########################################################################
+
+    def copy_ranges(self, ranges):
+        """
+            INTERNAL FUNCTION!
+
+            Copy byte ranges of the old documentation file into the new one.
+        """
+
+        if len(ranges) == 0:
+            return
+
+        with open(self.path, "rb") as source:
+            for start, end in ranges:
+                source.seek(start)
+
+                remaining = end - start
+                while remaining > 0:
+                    chunk = source.read(min(remaining, 1024 * 1024))
+                    if not chunk:
+                        break
+
+                    self.file.write(chunk)
+                    remaining -= len(chunk)
+
+    def moved_section(self, section, moved):
+        """
+            INTERNAL FUNCTION!
+
+            Return a copy of section index entry moved by `moved` bytes.
+        """
+
+        return {
+            'name': section['name'],
+            'hole': section['hole'],
+            'start': section['start'] + moved,
+            'end': section['end'] + moved,
+            'polygons': [offset + moved for offset in section['polygons']],
+        }
+
+    def ranges_between(self, start, end):
+        """
+            INTERNAL FUNCTION!
+
+            Byte ranges between `start` and `end` which are not part of a
+            section being replaced.
+        """
+
+        ranges = []
+        position = start
+
+        dropped = sorted((section['start'], section['end']) for section in self.sections
+                         if section not in self.kept)
+
+        for drop_start, drop_end in dropped:
+            if drop_end <= position or drop_start >= end:
+                continue
+
+            if drop_start > position:
+                ranges.append((position, drop_start))
+
+            position = max(position, drop_end)
+
+        if position < end:
+            ranges.append((position, end))
+
+        return ranges
@@ -0,0 +1,232 @@
+# AUTHOR Andrej Bartulin
+# PROJECT: B.A.G.E.R. parser
+# LICENSE: Polyform Shield License 1.0.0
+# DESCRIPTION: Caches of extracted elements
+
+import hashlib
+import json
+import numpy as np
+import os
+import shapely
+import tempfile
+
+# Bump when format of cache entries changes, changes of extractors are
+# detected by hashing their source code
+CACHE_VERSION = 2
+
+class ExtractorCache:
+    """
+        Cache extracted Shapely elements on disk, so unchanged files are not
+        extracted again.
+
+        Entries are keyed by the contents of the input file, parameters of
+        the extractor and source code of extractors, so an updated extractor
+        never gets elements extracted by an older one. Elements are stored
+        as WKB. When the cache grows
+        over `max_size`, least recently used entries are removed.
+
+        :param str directory: directory holding cache entries
+        :param int max_size: maximum size of all entries in bytes
+    """
+
+    def __init__(self, directory=".bager-cache", max_size=512 * 1024 * 1024):
+        """
+            Initialize variables.
+        """
+
+        self.directory = directory
+        self.max_size = max_size
+        self.code_version = self.get_code_version()
+
+    def get_elements(self, path, kind, parameters, extract):
+        """
+            Return elements of a file from the cache, or extract and cache them.
+
+            :param str path: path to the input file
+            :param str kind: name of the extractor, e.g. `dxf`
+            :param dict parameters: extractor parameters which change elements
+            :param function extract: function extracting elements, called on a miss
+        """
+
+        key = self.get_key(path, kind, parameters)
+
+        elements = self.load(key)
+        if elements != None:
+            print(f"[EXTRACTOR-CACHE] Loaded {len(elements)} elements of '{path}' from cache.")
+            return elements
+
+        elements = extract()
+        self.store(key, elements)
+
+        return elements
+
+    ###########################################################################
+    #####                                                                 #####
+    ###########################################################################
+
+    def get_key(self, path, kind, parameters):
+        """
+            INTERNAL FUNCTION!
+
+            Hash contents of a file together with extractor parameters.
+        """
+
+        digest = hashlib.sha256()
+        digest.update(json.dumps([CACHE_VERSION, self.code_version, kind, parameters],
+                                 sort_keys=True).encode("utf-8"))
+
+        with open(path, "rb") as file:
+            while True:
+                chunk = file.read(1024 * 1024)
+                if not chunk:
+                    break
+
+                digest.update(chunk)
+
+        return digest.hexdigest()
+
+    def get_code_version(self):
+        """
+            INTERNAL FUNCTION!
+
+            Hash source code of all extractors (modules next to this one).
+        """
+
+        directory = os.path.dirname(os.path.abspath(__file__))
+
+        digest = hashlib.sha256()
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".py"):
+                digest.update(name.encode("utf-8"))
+
+                with open(os.path.join(directory, name), "rb") as file:
+                    digest.update(file.read())
+
+        return digest.hexdigest()
+
+    def get_entry_path(self, key):
+        """
+            INTERNAL FUNCTION!
+
+            Return path of a cache entry.
+        """
+
+        return os.path.join(self.directory, key + ".npz")
+
+    def load(self, key):
+        """
+            INTERNAL FUNCTION!
+
+            Load elements of a cache entry, None if there is no such entry.
+        """
+
+        path = self.get_entry_path(key)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with np.load(path) as entry:
+                lengths = entry['lengths']
+                data = entry['data'].tobytes()
+
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[EXTRACTOR-CACHE] Broken cache entry '{path}' ({e}), ignoring it.")
+            return None
+
+        # Mark the entry as recently used
+        os.utime(path)
+
+        ends = np.cumsum(lengths)
+        starts = ends - lengths
+        return list(shapely.from_wkb([data[start:end] for start, end in zip(starts, ends)]))
+
+    def store(self, key, elements):
+        """
+            INTERNAL FUNCTION!
+
+            Store elements into a cache entry and evict old entries.
+        """
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        wkb = shapely.to_wkb(elements, output_dimension=3) if len(elements) > 0 else []
+        lengths = np.array([len(item) for item in wkb], dtype=np.int64)
+        data = np.frombuffer(b"".join(wkb), dtype=np.uint8)
+
+        # Entry appears at once, a crash never leaves half of it
+        descriptor, temp_path = tempfile.mkstemp(prefix=".entry-", suffix=".npz", dir=self.directory)
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                np.savez(file, lengths=lengths, data=data)
+
+            os.replace(temp_path, self.get_entry_path(key))
+
+        except OSError as e:
+            print(f"[EXTRACTOR-CACHE] Could not write cache entry ({e}).")
+
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+            return
+
+        self.evict()
+
+    def evict(self):
+        """
+            INTERNAL FUNCTION!
+
+            Remove least recently used entries until the cache fits into `max_size`.
+        """
+
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".npz") or name.startswith("."):
+                continue
+
+            path = os.path.join(self.directory, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+
+            os.remove(path)
+            total -= size
+
+class SharedExtractions:
+    """
+        Share extracted elements between sections of a single run.
+
+        Sections reading the same file with the same extractor parameters
+        extract it only once. Every section gets its own list of elements,
+        Shapely geometry itself is immutable, so no section can change
+        elements of another one.
+    """
+
+    def __init__(self):
+        """
+            Initialize variables.
+        """
+
+        self.extractions = {}
+
+    def get_elements(self, extractor):
+        """
+            Return elements of an extractor, extracting them on the first use.
+
+            :param extractor: DXF, Image or GIS extractor
+        """
+
+        key = (type(extractor).__name__, os.path.abspath(extractor.path),
+               json.dumps(extractor.get_parameters(), sort_keys=True))
+
+        if key not in self.extractions:
+            extractor.extract_entities()
+            self.extractions[key] = extractor.get_elements()
+
+        else:
+            print(f"[EXTRACTOR] Reusing elements of '{extractor.path}' extracted by another section.")
+
+        return list(self.extractions[key])
@@ -4,34 +4,55 @@
 # DESCRIPTION: .dxf extractor
 
 import ezdxf
+from ezdxf.addons import iterdxf
 import math
 import os
 import numpy as np
+import shapely
 from shapely.geometry import LineString, Point, Polygon
 
+from extractor.tessellation import arc_points, segment_count
+
 class DXF:
     """
         Extract .dxf entities and convert them into Shapely elements.
         
         :param str path: path to the .dxf file
+        :param float chord_tolerance: maximum distance between a curve and its tessellation, 0 uses 64 segments for every curve
+        :param bool streaming: read modelspace entities one by one instead of loading the whole document
+        :param list layers: names of layers to extract, empty list extracts all layers
+        :param list bbox: [min_x, min_y, max_x, max_y] area to extract, empty list extracts everything
+        :param ExtractorCache cache: cache of extracted elements, None disables caching
     """
 
-    def __init__(self, path):
+    def __init__(self, path, chord_tolerance=0.0, streaming=False, layers=[], bbox=[], cache=None):
         """
             Initialize variables.
         """
 
         self.path = path
+        self.chord_tolerance = chord_tolerance
+        self.streaming = streaming
+        self.cache = cache
         self.elements = []
 
+        # Layer names are case-insensitive in .dxf files
+        self.layers = set(layer.upper() for layer in layers)
+        self.bbox = tuple(bbox) if len(bbox) == 4 else None
+
+        # Shapely geometry of every block definition, in block coordinates
+        self.block_cache = {}
+        self.skipped_inserts = 0
+
         if not os.path.exists(path):
             print(f"[EXTRACTOR-DXF] File in path '{path}' does not exist!")
             print("[EXTRACTOR-DXF] Exiting...")
 
             exit(0)
 
-        self.doc = ezdxf.readfile(self.path)
-        self.modelspace = self.doc.modelspace()
+        # Document is loaded only when entities are not cached
+        self.doc = None
+        self.modelspace = None
 
     def execute(self):
         """
@@ -49,81 +70,278 @@ class DXF:
             Extract .dxf entities and convert them into Shapely geometry.
         """
 
-        for entity in self.modelspace:
-            match entity.dxftype():
-                case 'ARC':
-                    center = (entity.dxf.center.x, entity.dxf.center.y)
-                    radius = entity.dxf.radius
-                    start_angle = entity.dxf.start_angle
-                    end_angle = entity.dxf.end_angle
+        if self.cache != None:
+            self.elements.extend(self.cache.get_elements(self.path, "dxf",
+                                                         self.get_parameters(),
+                                                         self.read_elements))
 
-                    arc = self.arc_to_linestring(center, radius, start_angle, end_angle)
-                    self.elements.append(arc)
+        else:
+            self.elements.extend(self.read_elements())
 
-                case 'CIRCLE':
-                    center = (entity.dxf.center.x, entity.dxf.center.y)
-                    radius = entity.dxf.radius
-                    
-                    circle = Point(center).buffer(radius, resolution=64)
-                    self.elements.append(circle)
+    def get_elements(self):
+        """
+            Return Shapely elements.
+        """
 
-                case 'ELLIPSE':
-                    center = (entity.dxf.center.x, entity.dxf.center.y)
-                    major_axis = np.array([entity.dxf.major_axis.x, entity.dxf.major_axis.y])
-                    ratio = entity.dxf.ratio
-                    start_param = entity.dxf.start_param
-                    end_param = entity.dxf.end_param
-                    extrusion = np.array([entity.dxf.extrusion.x, entity.dxf.extrusion.y, entity.dxf.extrusion.z])
+        return self.elements
 
-                    # Calculate the length of the major axis (magnitude of the major_axis vector)
-                    major_axis_length = np.linalg.norm(major_axis)
+    def get_parameters(self):
+        """
+            Return extractor parameters which change extracted elements.
+        """
 
-                    # Calculate the minor axis by taking the cross product of extrusion and major_axis
-                    minor_axis = np.cross(extrusion, major_axis)
-                    minor_axis_length = np.linalg.norm(minor_axis)
-                    minor_axis = minor_axis / minor_axis_length * major_axis_length * ratio
+        return {
+            'chord_tolerance': self.chord_tolerance,
+            'streaming': self.streaming,
+            'layers': sorted(self.layers),
+            'bbox': self.bbox,
+        }
+    
+    ###########################################################################
+    #####                                                                 #####
+    ###########################################################################
+
+    def read_elements(self):
+        """
+            INTERNAL FUNCTION!
 
-                    ellipse = self.create_ellipse(center, major_axis, minor_axis, start_param, end_param)
-                    self.elements.append(ellipse)
+            Read the .dxf file and convert its entities into Shapely geometry.
+        """
 
-                case 'LINE':
-                    start_point = (entity.dxf.start.x, entity.dxf.start.y)
-                    end_point = (entity.dxf.end.x, entity.dxf.end.y)
+        if self.streaming == True:
+            # Entities are read one by one straight from the file,
+            # whole document is never loaded
+            entities = iterdxf.modelspace(self.path)
 
-                    self.elements.append(LineString([start_point, end_point]))
+        else:
+            self.doc = ezdxf.readfile(self.path)
+            self.modelspace = self.doc.modelspace()
 
-                case 'LWPOLYLINE':
-                    points = [(point[0], point[1]) for point in entity]
-                    self.elements.append(Polygon(points))
+            entities = self.modelspace
 
-                case 'SPLINE':
-                    control_points = [(p[0], p[1]) for p in entity.control_points]
-                    spline_line = LineString(control_points)
+        # Entities are filtered before any conversion
+        if len(self.layers) > 0:
+            entities = (entity for entity in entities
+                        if entity.dxf.layer.upper() in self.layers)
 
-                    self.elements.append(spline_line)
+        if self.bbox != None:
+            entities = (entity for entity in entities
+                        if self.entity_in_bbox(entity))
 
-                case 'DIMENSION':
-                    pass
+        elements = self.convert_entities(entities)
 
-                case _:
-                    pass
+        if self.bbox != None and len(elements) > 0:
+            # Extents of entities are only estimates and block references
+            # are not checked at all, drop what ended up outside
+            keep = shapely.intersects(shapely.box(*self.bbox), elements)
+            elements = [element for element, inside in zip(elements, keep) if inside]
 
-    def get_elements(self):
+        if self.skipped_inserts > 0:
+            print(f"[EXTRACTOR-DXF] Skipped {self.skipped_inserts} INSERT entities," +
+                  " block references are not supported in streaming mode!")
+
+        return elements
+
+    def convert_entities(self, entities):
         """
-            Return Shapely elements.
+            INTERNAL FUNCTION!
+
+            Convert .dxf entities into a list of Shapely geometry,
+            block references are expanded.
         """
 
-        return self.elements
-    
-    ###########################################################################
-    #####                                                                 #####
-    ###########################################################################
+        elements = []
+        for entity in entities:
+            if entity.dxftype() == 'INSERT':
+                elements.extend(self.expand_insert(entity))
+                continue
+
+            element = self.convert_entity(entity)
+            if element != None:
+                elements.append(element)
+
+        return elements
+
+    def expand_insert(self, entity):
+        """
+            INTERNAL FUNCTION!
+
+            Convert a .dxf INSERT entity into Shapely geometry of all entities
+            of its block. Block is converted only once, every reference just
+            transforms the cached geometry.
+        """
+
+        if self.streaming == True:
+            # Block definitions are not read when streaming
+            self.skipped_inserts += 1
+            return []
+
+        geometry = self.get_block_geometry(entity.dxf.name)
+        if len(geometry) == 0:
+            return []
+
+        # MINSERT places the block in a grid, every cell is its own reference
+        inserts = entity.multi_insert() if entity.mcount > 1 else [entity]
+
+        elements = []
+        for insert in inserts:
+            matrix = insert.matrix44()
+            linear = np.array([matrix.get_row(0)[:2], matrix.get_row(1)[:2]])
+            offset = np.array(matrix.get_row(3)[:2])
+
+            transformed = shapely.transform(geometry, lambda coords: coords @ linear + offset)
+            elements.extend(transformed)
+
+        return elements
+
+    def get_block_geometry(self, name):
+        """
+            INTERNAL FUNCTION!
+
+            Return cached Shapely geometry of a block definition,
+            converting it on the first use.
+        """
+
+        if name in self.block_cache:
+            return self.block_cache[name]
+
+        # Block referencing itself (directly or through other blocks)
+        # sees an empty block instead of recursing forever
+        self.block_cache[name] = np.array([], dtype=object)
+
+        block = self.doc.blocks.get(name)
+        if block == None:
+            print(f"[EXTRACTOR-DXF] Block '{name}' does not exist!")
+            return self.block_cache[name]
+
+        elements = self.convert_entities(block)
+
+        geometry = np.empty(len(elements), dtype=object)
+        geometry[:] = elements
+
+        self.block_cache[name] = geometry
+        return geometry
+
+    def entity_in_bbox(self, entity):
+        """
+            INTERNAL FUNCTION!
+
+            Check if a rough extent of a .dxf entity overlaps `self.bbox`,
+            without converting it. Entities with unknown extent pass.
+        """
+
+        match entity.dxftype():
+            case 'ARC' | 'CIRCLE':
+                x, y = entity.dxf.center.x, entity.dxf.center.y
+                radius = entity.dxf.radius
+
+                extent = (x - radius, y - radius, x + radius, y + radius)
+
+            case 'ELLIPSE':
+                x, y = entity.dxf.center.x, entity.dxf.center.y
+                radius = math.hypot(entity.dxf.major_axis.x, entity.dxf.major_axis.y)
+
+                extent = (x - radius, y - radius, x + radius, y + radius)
+
+            case 'LINE':
+                start, end = entity.dxf.start, entity.dxf.end
+
+                extent = (min(start.x, end.x), min(start.y, end.y),
+                          max(start.x, end.x), max(start.y, end.y))
+
+            case 'LWPOLYLINE' | 'SPLINE':
+                if entity.dxftype() == 'LWPOLYLINE':
+                    points = np.array([(point[0], point[1]) for point in entity])
+
+                else:
+                    points = np.array([(point[0], point[1]) for point in entity.control_points])
+
+                if len(points) == 0:
+                    return False
+
+                extent = (*points.min(axis=0), *points.max(axis=0))
+
+            case _:
+                return True
+
+        min_x, min_y, max_x, max_y = self.bbox
+        return (extent[0] <= max_x and extent[2] >= min_x and
+                extent[1] <= max_y and extent[3] >= min_y)
+
+    def convert_entity(self, entity):
+        """
+            INTERNAL FUNCTION!
+
+            Convert a single .dxf entity into Shapely geometry,
+            returns None for unsupported entities.
+        """
+
+        match entity.dxftype():
+            case 'ARC':
+                center = (entity.dxf.center.x, entity.dxf.center.y)
+                radius = entity.dxf.radius
+                start_angle = entity.dxf.start_angle
+                end_angle = entity.dxf.end_angle
+
+                arc = self.arc_to_linestring(center, radius, start_angle, end_angle)
+                return arc
+
+            case 'CIRCLE':
+                center = (entity.dxf.center.x, entity.dxf.center.y)
+                radius = entity.dxf.radius
+                
+                circle = self.create_circle(center, radius)
+                return circle
+
+            case 'ELLIPSE':
+                center = (entity.dxf.center.x, entity.dxf.center.y)
+                major_axis = np.array([entity.dxf.major_axis.x, entity.dxf.major_axis.y])
+                ratio = entity.dxf.ratio
+                start_param = entity.dxf.start_param
+                end_param = entity.dxf.end_param
+                extrusion = np.array([entity.dxf.extrusion.x, entity.dxf.extrusion.y, entity.dxf.extrusion.z])
+
+                # Calculate the length of the major axis (magnitude of the major_axis vector)
+                major_axis_length = np.linalg.norm(major_axis)
+
+                # Calculate the minor axis by taking the cross product of extrusion and major_axis
+                minor_axis = np.cross(extrusion, major_axis)
+                minor_axis_length = np.linalg.norm(minor_axis)
+                minor_axis = minor_axis / minor_axis_length * major_axis_length * ratio
+
+                ellipse = self.create_ellipse(center, major_axis, minor_axis, start_param, end_param)
+                return ellipse
+
+            case 'LINE':
+                start_point = (entity.dxf.start.x, entity.dxf.start.y)
+                end_point = (entity.dxf.end.x, entity.dxf.end.y)
+
+                return LineString([start_point, end_point])
+
+            case 'LWPOLYLINE':
+                points = [(point[0], point[1]) for point in entity]
+                return Polygon(points)
+
+            case 'SPLINE':
+                control_points = [(p[0], p[1]) for p in entity.control_points]
+                spline_line = LineString(control_points)
+
+                return spline_line
+
+            case 'DIMENSION':
+                pass
+
+            case _:
+                pass
+
+        return None
 
     def arc_to_linestring(self, center, radius, start_angle, end_angle, num_segments=64):
         """
             INTERNAL FUNCTION!
 
             Convert a .dxf ARC entity into a Shapely LineString.
+            With a chord tolerance, number of segments follows radius and sweep.
         """
         
         # Convert start and end angles from degrees to radians
@@ -134,6 +352,10 @@ class DXF:
         if end_rad < start_rad:
             end_rad += 2 * math.pi
         
+        if self.chord_tolerance > 0:
+            segments = segment_count(radius, end_rad - start_rad, self.chord_tolerance)
+            return LineString(arc_points(center, radius, start_rad, end_rad, segments))
+
         # Generate points along the arc using a linear space of angles
         angles = np.linspace(start_rad, end_rad, num_segments)
         points = [(center[0] + radius * math.cos(theta), center[1] + radius * math.sin(theta)) for theta in angles]
@@ -147,6 +369,14 @@ class DXF:
             Convert a .dxf ELLIPSE entity into a Shapely Polygon.
         """
         
+        if self.chord_tolerance > 0:
+            # Ellipse is a circle of the major radius squashed along the minor
+            # axis, its chords never deviate more than the circle ones
+            sweep = end_param - start_param
+            minimum = 3 if math.isclose(abs(sweep), 2 * math.pi) else 1
+            resolution = segment_count(np.linalg.norm(major_axis), sweep,
+                                       self.chord_tolerance, minimum) + 1
+
         # Parametric equations for an ellipse
         theta = np.linspace(start_param, end_param, resolution)
         x = center[0] + major_axis[0] * np.cos(theta) + minor_axis[0] * np.sin(theta)
@@ -155,3 +385,16 @@ class DXF:
         # Create the polygon approximation of the ellipse
         points = list(zip(x, y))
         return Polygon(points)
+
+    def create_circle(self, center, radius):
+        """
+            INTERNAL FUNCTION!
+
+            Convert a .dxf CIRCLE entity into a Shapely Polygon.
+        """
+
+        if self.chord_tolerance <= 0:
+            return Point(center).buffer(radius, resolution=64)
+
+        segments = segment_count(radius, 2 * math.pi, self.chord_tolerance, minimum=3)
+        return Polygon(arc_points(center, radius, 0.0, 2 * math.pi, segments)[:-1])
@@ -0,0 +1,180 @@
+# AUTHOR Andrej Bartulin
+# PROJECT: B.A.G.E.R. parser
+# LICENSE: Polyform Shield License 1.0.0
+# DESCRIPTION: Streaming GeoJSON reader
+
+import json
+from shapely.geometry import shape
+
+# Number of characters read from the file at once
+CHUNK_SIZE = 1024 * 1024
+
+class GeoJSONReader:
+    """
+        Read geometry of a GeoJSON file feature by feature.
+
+        Only the feature being decoded (and a chunk of the file around it)
+        is held in memory, so memory use does not grow with the file size.
+        FeatureCollection members are streamed, any other GeoJSON object
+        (a single Feature or a bare geometry) is decoded whole.
+
+        :param str path: path to the GeoJSON file
+    """
+
+    def __init__(self, path):
+        """
+            Initialize variables.
+        """
+
+        self.path = path
+        self.decoder = json.JSONDecoder()
+
+        self.file = None
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+
+    def geometries(self):
+        """
+            Yield Shapely geometry of every feature, features without
+            geometry are skipped.
+        """
+
+        with open(self.path, "r", encoding="utf-8-sig") as file:
+            self.file = file
+            self.buffer = ""
+            self.position = 0
+            self.eof = False
+
+            if self.next_char() != "{":
+                raise ValueError(f"[EXTRACTOR-GEOJSON] '{self.path}' is not a GeoJSON object!")
+
+            self.position += 1
+
+            # Members of the top level object other than `features`
+            members = {}
+            streamed = False
+
+            while True:
+                char = self.next_char()
+                if char == ",":
+                    self.position += 1
+                    continue
+
+                if char == "}":
+                    break
+
+                key = self.decode_value()
+                if self.next_char() != ":":
+                    raise ValueError(f"[EXTRACTOR-GEOJSON] Malformed object in '{self.path}'!")
+
+                self.position += 1
+
+                if key == "features" and self.next_char() == "[":
+                    self.position += 1
+                    streamed = True
+
+                    for feature in self.features():
+                        if feature.get("geometry") != None:
+                            yield shape(feature["geometry"])
+
+                else:
+                    members[key] = self.decode_value()
+
+        if streamed == True:
+            return
+
+        # Not a FeatureCollection, the whole object has been decoded
+        if members.get("type") == "Feature":
+            if members.get("geometry") != None:
+                yield shape(members["geometry"])
+
+        elif "type" in members:
+            yield shape(members)
+
+    ###########################################################################
+    #####                                                                 #####
+    ###########################################################################
+
+    def features(self):
+        """
+            INTERNAL FUNCTION!
+
+            Yield features of the `features` array one at a time.
+        """
+
+        while True:
+            char = self.next_char()
+            if char == ",":
+                self.position += 1
+                continue
+
+            if char == "]":
+                self.position += 1
+                return
+
+            yield self.decode_value()
+
+    def next_char(self):
+        """
+            INTERNAL FUNCTION!
+
+            Skip whitespace and return the next character without consuming it.
+        """
+
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in " \t\r\n":
+                self.position += 1
+
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+
+            if not self.read_chunk():
+                raise ValueError(f"[EXTRACTOR-GEOJSON] Unexpected end of '{self.path}'!")
+
+    def decode_value(self):
+        """
+            INTERNAL FUNCTION!
+
+            Decode the JSON value at current position, reading more of the
+            file while the value is incomplete.
+        """
+
+        self.next_char()
+
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+
+                # A number at the end of the buffer might continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.position = end
+                    return value
+
+            except json.JSONDecodeError as e:
+                if self.eof:
+                    raise ValueError(f"[EXTRACTOR-GEOJSON] Malformed '{self.path}': {e}")
+
+            self.read_chunk()
+
+    def read_chunk(self):
+        """
+            INTERNAL FUNCTION!
+
+            Append the next chunk of the file to the buffer, dropping what has
+            already been decoded. Returns False at the end of the file.
+        """
+
+        if self.eof:
+            return False
+
+        # Chunks grow with the value being decoded, so a huge feature
+        # is not decoded again after every small chunk
+        chunk = self.file.read(max(CHUNK_SIZE, len(self.buffer) - self.position))
+        if not chunk:
+            self.eof = True
+            return False
+
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
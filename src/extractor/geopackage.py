@@ -0,0 +1,153 @@
+# AUTHOR Andrej Bartulin
+# PROJECT: B.A.G.E.R. parser
+# LICENSE: Polyform Shield License 1.0.0
+# DESCRIPTION: GeoPackage reader
+
+import pathlib
+import shapely
+import sqlite3
+
+# Size of the envelope for every envelope indicator of the GeoPackage header
+ENVELOPE_SIZES = {0: 0, 1: 32, 2: 48, 3: 48, 4: 64}
+
+# Number of rows decoded at once
+BATCH_SIZE = 10000
+
+class GeoPackageReader:
+    """
+        Read geometry of GeoPackage feature tables.
+
+        When a bounding box is given and a table has a spatial index, only
+        rows whose R-tree envelope overlaps the box are fetched. Geometry
+        blobs are decoded in batches with a single Shapely call.
+
+        :param str path: path to the `.gpkg` file
+        :param list tables: names of feature tables to read, empty list reads all
+        :param tuple bbox: (min_x, min_y, max_x, max_y) area to read, None reads everything
+    """
+
+    def __init__(self, path, tables=[], bbox=None):
+        """
+            Initialize variables.
+        """
+
+        self.path = path
+        self.tables = set(table.lower() for table in tables)
+        self.bbox = bbox
+
+    def geometries(self):
+        """
+            Yield Shapely geometry of all features.
+        """
+
+        uri = pathlib.Path(self.path).absolute().as_uri() + "?mode=ro"
+        connection = sqlite3.connect(uri, uri=True)
+
+        try:
+            for table, column in self.get_feature_tables(connection):
+                cursor = connection.execute(*self.get_query(connection, table, column))
+
+                while True:
+                    rows = cursor.fetchmany(BATCH_SIZE)
+                    if len(rows) == 0:
+                        break
+
+                    yield from self.decode([row[0] for row in rows])
+
+        finally:
+            connection.close()
+
+    ###########################################################################
+    #####                                                                 #####
+    ###########################################################################
+
+    def get_feature_tables(self, connection):
+        """
+            INTERNAL FUNCTION!
+
+            Return (table, geometry column) of every feature table to read.
+        """
+
+        try:
+            rows = connection.execute("SELECT table_name, column_name FROM gpkg_geometry_columns").fetchall()
+
+        except sqlite3.DatabaseError as e:
+            raise ValueError(f"[EXTRACTOR-GEOPACKAGE] '{self.path}' is not a GeoPackage ({e})!")
+
+        if len(self.tables) > 0:
+            rows = [row for row in rows if row[0].lower() in self.tables]
+
+            if len(rows) == 0:
+                print(f"[EXTRACTOR-GEOPACKAGE] None of the tables {sorted(self.tables)}" +
+                      f" exist in '{self.path}'!")
+
+        return rows
+
+    def get_query(self, connection, table, column):
+        """
+            INTERNAL FUNCTION!
+
+            Return SQL query (and its parameters) fetching geometry of a table,
+            filtered through its R-tree index when there is a bounding box.
+        """
+
+        query = f'SELECT "{self.quote(column)}" FROM "{self.quote(table)}"'
+
+        if self.bbox == None:
+            return (query, ())
+
+        index = f"rtree_{table}_{column}"
+        exists = connection.execute("SELECT count(*) FROM sqlite_master WHERE name = ?",
+                                    (index,)).fetchone()[0]
+
+        if exists == 0:
+            print(f"[EXTRACTOR-GEOPACKAGE] Table '{table}' has no spatial index," +
+                  " reading all of its rows.")
+
+            return (query, ())
+
+        # R-tree ids are the primary keys (row ids) of the feature table
+        min_x, min_y, max_x, max_y = self.bbox
+        query += (f' WHERE rowid IN (SELECT id FROM "{self.quote(index)}"' +
+                  " WHERE minx <= ? AND maxx >= ? AND miny <= ? AND maxy >= ?)")
+
+        return (query, (max_x, min_x, max_y, min_y))
+
+    def decode(self, blobs):
+        """
+            INTERNAL FUNCTION!
+
+            Strip GeoPackage headers from geometry blobs and decode their WKB.
+        """
+
+        wkb = []
+        for blob in blobs:
+            if blob == None or len(blob) < 8 or blob[:2] != b"GP":
+                continue
+
+            flags = blob[3]
+
+            # Empty geometry or extended (non-standard) geometry type
+            if flags & 0x10 or flags & 0x20:
+                continue
+
+            envelope = ENVELOPE_SIZES.get((flags >> 1) & 0x07)
+            if envelope == None:
+                continue
+
+            wkb.append(blob[8 + envelope:])
+
+        if len(wkb) == 0:
+            return []
+
+        geometries = shapely.from_wkb(wkb, on_invalid="ignore")
+        return list(geometries[~shapely.is_missing(geometries)])
+
+    def quote(self, name):
+        """
+            INTERNAL FUNCTION!
+
+            Escape a name for use inside double quotes in SQL.
+        """
+
+        return name.replace('"', '""')
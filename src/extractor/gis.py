@@ -4,20 +4,32 @@
 # DESCRIPTION: GIS extractor
 
 import os
+import shapely
+from shapely.geometry import GeometryCollection, LineString, MultiLineString, MultiPolygon, Polygon
+
+from extractor.geojson import GeoJSONReader
+from extractor.geopackage import GeoPackageReader
+from extractor.shapefile import ShapefileReader
 
 class GIS:
     """
         Extract GIS entities and convert them into Shapely elements.
 
         :param str path: path to the GIS file
+        :param list layers: names of GeoPackage tables to extract, empty list extracts all tables
+        :param list bbox: [min_x, min_y, max_x, max_y] area to extract, empty list extracts everything
+        :param ExtractorCache cache: cache of extracted elements, None disables caching
     """
 
-    def __init__(self, path):
+    def __init__(self, path, layers=[], bbox=[], cache=None):
         """
             Initialize variables.
         """
 
         self.path = path
+        self.layers = list(layers)
+        self.bbox = tuple(bbox) if len(bbox) == 4 else None
+        self.cache = cache
         self.elements = []
 
         if not os.path.exists(path):
@@ -42,7 +54,13 @@ class GIS:
             Extract GIS entities and convert them into Shapely geometry.
         """
 
-        pass
+        if self.cache != None:
+            self.elements.extend(self.cache.get_elements(self.path, "gis",
+                                                         self.get_parameters(),
+                                                         self.read_elements))
+
+        else:
+            self.elements.extend(self.read_elements())
 
     def get_elements(self):
         """
@@ -50,3 +68,78 @@ class GIS:
         """
 
         return self.elements
+
+    def get_parameters(self):
+        """
+            Return extractor parameters which change extracted elements.
+        """
+
+        return {
+            'layers': sorted(layer.lower() for layer in self.layers),
+            'bbox': self.bbox,
+        }
+
+    ###########################################################################
+    #####                                                                 #####
+    ###########################################################################
+
+    def read_elements(self):
+        """
+            INTERNAL FUNCTION!
+
+            Read the GIS file and convert its entities into Shapely geometry.
+        """
+
+        extension = os.path.splitext(self.path)[1].lower()
+
+        match extension:
+            case ".geojson" | ".json":
+                geometries = GeoJSONReader(self.path).geometries()
+
+            case ".shp":
+                # Records outside the bounding box are skipped by the reader
+                geometries = ShapefileReader(self.path, self.bbox).geometries()
+
+            case ".gpkg":
+                # Rows outside the bounding box are skipped through the spatial index
+                geometries = GeoPackageReader(self.path, self.layers, self.bbox).geometries()
+
+            case _:
+                print(f"[EXTRACTOR-GIS] Unsupported GIS file format '{extension}'!")
+                return []
+
+        area = shapely.box(*self.bbox) if self.bbox != None else None
+
+        elements = []
+        for geometry in geometries:
+            if area != None and not shapely.intersects(area, geometry):
+                continue
+
+            elements.extend(self.split_parts(geometry))
+
+        return elements
+
+    def split_parts(self, geometry):
+        """
+            INTERNAL FUNCTION!
+
+            Split geometry into polygons and linestrings, other geometry
+            (e.g. points) is dropped.
+        """
+
+        if geometry.is_empty:
+            return []
+
+        match geometry:
+            case Polygon() | LineString():
+                return [geometry]
+
+            case MultiPolygon() | MultiLineString() | GeometryCollection():
+                parts = []
+                for part in geometry.geoms:
+                    parts.extend(self.split_parts(part))
+
+                return parts
+
+            case _:
+                return []
@@ -3,11 +3,22 @@
 # LICENSE: Polyform Shield License 1.0.0
 # DESCRIPTION: image extractor
 
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
 import os
+import shapely
 from shapely.geometry import LineString, Polygon
 
+# Parameters of the extraction
+THRESHOLD_VALUE = 200
+MIN_CONTOUR_AREA = 30
+MORPH_KERNEL_SIZE = 3
+
+# Largest sine of the turn at a vertex still counted as collinear, so
+# vertices of float coordinates are merged even when not exactly collinear
+COLLINEAR_TOLERANCE = 1e-6
+
 class Image:
     """
         Extract entities from an image and convert them into Shapely elements.
@@ -17,9 +28,17 @@ class Image:
         :param bool flip_y: should we flip by Y axis
         :param float simplify_tolerance: threshold value controlling the level of simplification
         :param bool remove_colinear: do you want to remove colinear points in a polygon
+        :param list contour_reduction: steps reducing contour vertices (`chain`, `douglas_peucker`, `collinear`), applied in order
+        :param float reduction_tolerance: maximum distance (in pixels) of a removed vertex, used by `douglas_peucker`
+        :param int tile_size: size (in pixels) of tiles processed one at a time, 0 processes the whole image at once
+        :param int coarse_level: pyramid level searched for regions with contours first (every level halves the image), 0 searches the whole image
+        :param int workers: number of threads finding contours of separate shapes in parallel, 1 finds all contours at once in the calling thread
+        :param ExtractorCache cache: cache of extracted elements, None disables caching
     """
 
-    def __init__(self, path, debug, flip_y, simplify_tolerance, remove_colinear):
+    def __init__(self, path, debug, flip_y, simplify_tolerance, remove_colinear,
+                 contour_reduction=[], reduction_tolerance=1.0, tile_size=0, coarse_level=0,
+                 workers=1, cache=None):
         """
             Initialize variables.
         """
@@ -39,6 +58,21 @@ class Image:
         self.simplify_tolerance = simplify_tolerance
         self.remove_colinear = remove_colinear
 
+        self.contour_reduction = []
+        for step in contour_reduction:
+            if step not in ("chain", "douglas_peucker", "collinear"):
+                print(f"[EXTRACTOR-IMAGE] Unknown contour reduction step '{step}', skipping it!")
+                continue
+
+            self.contour_reduction.append(step)
+
+        self.reduction_tolerance = reduction_tolerance
+        self.tile_size = tile_size
+        self.coarse_level = coarse_level
+        self.workers = workers
+
+        self.cache = cache
+
     def execute(self):
         """
             Extract.
@@ -55,13 +89,50 @@ class Image:
             Extract entities from an image and convert them to Shapely geometry.
         """
 
-        #########################################
-        # Parameters
-        #########################################
+        # Debug mode shows the extraction, so it always runs
+        if self.cache != None and self.debug == False:
+            self.elements.extend(self.cache.get_elements(self.path, "image",
+                                                         self.get_parameters(),
+                                                         self.read_elements))
 
-        THRESHOLD_VALUE = 200
-        MIN_CONTOUR_AREA = 30
-        MORPH_KERNEL_SIZE = 3
+        else:
+            self.elements.extend(self.read_elements())
+
+    def get_elements(self):
+        """
+            Return Shapely elements.
+        """
+
+        return self.elements
+
+    def get_parameters(self):
+        """
+            Return extractor parameters which change extracted elements.
+        """
+
+        return {
+            'flip_y': self.flip_y,
+            'simplify_tolerance': self.simplify_tolerance,
+            'remove_colinear': self.remove_colinear,
+            'contour_reduction': self.contour_reduction,
+            'reduction_tolerance': self.reduction_tolerance,
+            'tile_size': self.tile_size,
+            'coarse_level': self.coarse_level,
+        }
+    
+    ###########################################################################
+    #####                                                                 #####
+    ###########################################################################
+
+    def read_elements(self):
+        """
+            INTERNAL FUNCTION!
+
+            Read the image and convert its contours into Shapely geometry.
+        """
+
+        if self.tile_size > 0:
+            return self.read_elements_tiled()
 
         #########################################
         # Load image
@@ -73,6 +144,67 @@ class Image:
         
         height, width = image.shape[:2]
 
+        #########################################
+        # Find contours (vector extraction)
+        #########################################
+
+        if self.coarse_level > 0:
+            contours = self.find_contours_coarse(image)
+
+            # Only regions with contours have been thresholded
+            binary = self.binarize(image) if self.debug == True else None
+
+            if self.debug == True:
+                self.check_coarse_contours(contours, binary)
+
+        elif self.workers > 1:
+            binary = self.binarize(image)
+            contours = self.find_contours_parallel(binary)
+
+        else:
+            binary = self.binarize(image)
+
+            contours, _ = cv2.findContours(
+                binary,
+                cv2.RETR_EXTERNAL,
+                cv2.CHAIN_APPROX_NONE
+            )
+
+        #########################################
+        # Convert to Shapely geometry
+        #########################################
+
+        elements = self.contours_to_shapely(
+            contours,
+            height,
+            MIN_CONTOUR_AREA
+        )
+
+        #########################################
+        # Visualization
+        #########################################
+        if self.debug == True:
+            self.visualize(image, binary, contours, MIN_CONTOUR_AREA)
+
+        return elements
+
+    def binarize(self, image):
+        """
+            INTERNAL FUNCTION!
+
+            Threshold a grayscale image (or its part) into a binary image
+            and clean it up.
+        """
+
+        return self.close_gaps(self.threshold(image))
+
+    def threshold(self, image):
+        """
+            INTERNAL FUNCTION!
+
+            Threshold a grayscale image (or its part) into a binary image.
+        """
+
         #########################################
         # Binary threshold
         # Black lines on white background
@@ -85,51 +217,414 @@ class Image:
             cv2.THRESH_BINARY_INV
         )
 
+        return binary
+
+    def close_gaps(self, binary):
+        """
+            INTERNAL FUNCTION!
+
+            Clean up a binary image (or its part).
+        """
+
         #########################################
         # Morphological cleanup
         # (connect broken lines)
         #########################################
 
         kernel = np.ones((MORPH_KERNEL_SIZE, MORPH_KERNEL_SIZE), np.uint8)
-        binary = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+        return cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
 
-        #########################################
-        # Find contours (vector extraction)
-        #########################################
+    def find_contours_coarse(self, image):
+        """
+            INTERNAL FUNCTION!
 
-        contours, _ = cv2.findContours(
-            binary,
-            cv2.RETR_EXTERNAL,
-            cv2.CHAIN_APPROX_NONE
-        )
+            Find contours of the image only inside regions which have dark
+            pixels on a coarse pyramid level, skipping blank paper.
 
-        #########################################
-        # Convert to Shapely geometry
-        #########################################
+            A pixel of the coarse level is dark when any pixel of its block is
+            dark, so no dark pixel is missed. Coarse regions are grown by a
+            pixel, so pixels joined by the morphological cleanup stay in one
+            region. Overlapping regions are merged, so every contour lies in
+            a single region and contours match contours of the whole image.
+        """
 
-        self.contours_to_shapely(
-            contours,
-            height,
-            MIN_CONTOUR_AREA
-        )
+        height, width = image.shape[:2]
+        block = 2 ** self.coarse_level
+
+        binary = self.threshold(image)
+
+        # Every level halves the image, so it must be divisible into blocks
+        coarse = binary
+        if height % block != 0 or width % block != 0:
+            coarse = cv2.copyMakeBorder(binary, 0, -height % block, 0, -width % block,
+                                        cv2.BORDER_CONSTANT, value=0)
+
+        for _ in range(self.coarse_level):
+            coarse = cv2.resize(coarse, (coarse.shape[1] // 2, coarse.shape[0] // 2),
+                                interpolation=cv2.INTER_AREA)
+            _, coarse = cv2.threshold(coarse, 0, 255, cv2.THRESH_BINARY)
+
+        coarse = cv2.dilate(coarse, np.ones((3, 3), np.uint8))
+
+        count, _, stats, _ = cv2.connectedComponentsWithStats(coarse, connectivity=8)
+        if count <= 1:
+            return []
+
+        # Regions in pixels of the image, with a margin for the morphological cleanup
+        x, y, w, h = stats[1:, :4].T.astype(np.int64)
+        boxes = shapely.box(np.maximum(x * block - MORPH_KERNEL_SIZE, 0),
+                            np.maximum(y * block - MORPH_KERNEL_SIZE, 0),
+                            np.minimum((x + w) * block + MORPH_KERNEL_SIZE, width),
+                            np.minimum((y + h) * block + MORPH_KERNEL_SIZE, height))
+
+        # Merge overlapping regions until no two of them overlap
+        while True:
+            merged = shapely.envelope(shapely.get_parts(shapely.union_all(boxes)))
+            if len(merged) == len(boxes):
+                break
+
+            boxes = merged
+
+        # Regions covering most of the image save nothing
+        if shapely.area(boxes).sum() > 0.5 * width * height:
+            contours, _ = cv2.findContours(
+                self.close_gaps(binary),
+                cv2.RETR_EXTERNAL,
+                cv2.CHAIN_APPROX_NONE
+            )
+
+            return contours
+
+        contours = []
+        for left, top, right, bottom in shapely.bounds(boxes).astype(np.int64):
+            region_contours, _ = cv2.findContours(
+                self.close_gaps(binary[top:bottom, left:right]),
+                cv2.RETR_EXTERNAL,
+                cv2.CHAIN_APPROX_NONE,
+                offset=(int(left), int(top))
+            )
+
+            contours.extend(region_contours)
+
+        # Regions are searched one by one, contours get the order of the whole image
+        return self.sort_contours(contours)
+
+    def find_contours_parallel(self, binary):
+        """
+            INTERNAL FUNCTION!
+
+            Find outer contours of the binary image one connected component
+            at a time in a pool of threads. OpenCV and NumPy release the GIL,
+            so components are traced on several cores at once.
+
+            Like contours of the whole image, contours of components lying
+            inside a hole of another component are dropped.
+        """
+
+        # Block-based labelling of Grana et al. is the fastest one on plans
+        count, labels, stats, _ = cv2.connectedComponentsWithStatsWithAlgorithm(
+            binary, 8, cv2.CV_32S, cv2.CCL_GRANA)
+        if count <= 1:
+            return []
+
+        def trace(label):
+            x, y, w, h = (int(value) for value in stats[label, :4])
+            mask = (labels[y:y + h, x:x + w] == label).astype(np.uint8)
+
+            # Only the component is in the mask, so it has one outer contour
+            component_contours, _ = cv2.findContours(
+                mask,
+                cv2.RETR_EXTERNAL,
+                cv2.CHAIN_APPROX_NONE,
+                offset=(x, y)
+            )
+
+            return component_contours[0]
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            contours = list(executor.map(trace, range(1, count)))
+
+        # A component inside a hole lies in the bounding box of the enclosing
+        # component, so only those contours are tested
+        x, y, w, h = stats[1:, :4].T
+        tree = shapely.STRtree(shapely.box(x, y, x + w - 1, y + h - 1))
+        starts = np.array([cnt[0, 0] for cnt in contours])
+
+        inner, outer = tree.query(shapely.points(starts), predicate="intersects")
+        nested = np.zeros(len(contours), dtype=bool)
+
+        for i, j in zip(inner, outer):
+            if i != j and nested[i] == False:
+                point = (float(starts[i][0]), float(starts[i][1]))
+                nested[i] = cv2.pointPolygonTest(contours[j], point, False) > 0
+
+        kept = [cnt for cnt, inside in zip(contours, nested) if not inside]
+
+        # Components are traced one by one, contours get the order of the whole image
+        return self.sort_contours(kept)
+
+    def read_elements_tiled(self):
+        """
+            INTERNAL FUNCTION!
+
+            Read the image tile by tile and convert its contours into Shapely
+            geometry, so only a tile of the image is thresholded at once.
+
+            Every tile is read with a margin, so the morphological cleanup of
+            its core matches the cleanup of the whole image. Cores of
+            neighbouring tiles share a row and a column of pixels, so pieces of
+            a contour split by a tile border overlap and are joined again.
+        """
+
+        image = self.open_raster()
+        height, width = image.shape[:2]
+
+        # Pixels around a core changing its morphological cleanup
+        margin = MORPH_KERNEL_SIZE
+
+        contours = []
+        pieces = []
+
+        for top in range(0, height, self.tile_size):
+            for left in range(0, width, self.tile_size):
+                bottom = min(top + self.tile_size + 1, height)
+                right = min(left + self.tile_size + 1, width)
+
+                window_top = max(top - margin, 0)
+                window_left = max(left - margin, 0)
+                window = self.to_grayscale(np.asarray(image[window_top:min(bottom + margin, height),
+                                                            window_left:min(right + margin, width)]))
+
+                binary = self.binarize(window)[top - window_top:bottom - window_top,
+                                               left - window_left:right - window_left]
+
+                tile_contours, _ = cv2.findContours(
+                    np.ascontiguousarray(binary),
+                    cv2.RETR_EXTERNAL,
+                    cv2.CHAIN_APPROX_NONE,
+                    offset=(left, top)
+                )
+
+                for cnt in tile_contours:
+                    coords = cnt.reshape(-1, 2)
+                    low = coords.min(axis=0)
+                    high = coords.max(axis=0)
+
+                    # Contour reaching a border shared with another tile
+                    if ((low[0] == left and left > 0) or (low[1] == top and top > 0) or
+                        (high[0] == right - 1 and right < width) or
+                        (high[1] == bottom - 1 and bottom < height)):
+                        pieces.append(cnt)
+
+                    else:
+                        contours.append(cnt)
+
+        contours = self.stitch_pieces(pieces, contours)
 
-        #########################################
-        # Visualization
-        #########################################
         if self.debug == True:
-            self.visualize(image, binary, contours, MIN_CONTOUR_AREA)
-    
-    def get_elements(self):
+            print("[EXTRACTOR-IMAGE-DEBUG] Visualization is not available for tiled images," +
+                  f" detected contours: {len(contours)}")
+
+        return self.contours_to_shapely(contours, height, MIN_CONTOUR_AREA)
+
+    def open_raster(self):
         """
-            Return Shapely elements.
+            INTERNAL FUNCTION!
+
+            Open the image for reading tiles. NumPy arrays (`.npy`) and binary
+            8-bit PGM images are memory-mapped, other formats can only be
+            decoded as a whole.
         """
 
-        return self.elements
-    
-    ###########################################################################
-    #####                                                                 #####
-    ###########################################################################
-    
+        extension = os.path.splitext(self.path)[1].lower()
+
+        if extension == ".npy":
+            return np.load(self.path, mmap_mode="r")
+
+        if extension == ".pgm":
+            header = self.read_pgm_header()
+            if header != None:
+                offset, width, height = header
+                return np.memmap(self.path, dtype=np.uint8, mode="r", offset=offset,
+                                 shape=(height, width))
+
+        print(f"[EXTRACTOR-IMAGE] '{self.path}' can not be memory-mapped, decoding the whole image.")
+
+        image = cv2.imread(self.path, cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            raise IOError("[EXTRACTOR-IMAGE] Image has not been found!")
+
+        return image
+
+    def read_pgm_header(self):
+        """
+            INTERNAL FUNCTION!
+
+            Return (offset of pixels, width, height) of a binary 8-bit PGM
+            image, None for any other image.
+        """
+
+        with open(self.path, "rb") as file:
+            data = file.read(4096)
+
+        fields = []
+        position = 2
+        if data[:2] != b"P5":
+            return None
+
+        # Magic number is followed by width, height and maximum value,
+        # separated by whitespace and comments
+        while len(fields) < 3:
+            while position < len(data) and data[position:position + 1].isspace():
+                position += 1
+
+            if data[position:position + 1] == b"#":
+                position = data.find(b"\n", position)
+                if position < 0:
+                    return None
+
+                continue
+
+            start = position
+            while position < len(data) and data[position:position + 1].isdigit():
+                position += 1
+
+            if start == position:
+                return None
+
+            fields.append(int(data[start:position]))
+
+        width, height, max_value = fields
+        if max_value > 255:
+            return None
+
+        # A single whitespace character separates the header from pixels
+        return (position + 1, width, height)
+
+    def to_grayscale(self, image):
+        """
+            INTERNAL FUNCTION!
+
+            Convert a part of a color image into grayscale.
+        """
+
+        if image.ndim == 2:
+            return image
+
+        if image.shape[2] == 4:
+            return cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY)
+
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    def stitch_pieces(self, pieces, contours):
+        """
+            INTERNAL FUNCTION!
+
+            Join pieces of contours split by tile borders into whole contours
+            and return them together with `contours` of single tiles, in the
+            order of contours of the whole image.
+            Like contours of the whole image, only outer contours are kept,
+            so holes of joined pieces are dropped together with contours
+            lying inside them.
+        """
+
+        if len(pieces) == 0:
+            return self.sort_contours(contours)
+
+        # Contours run through centres of pixels, so pieces of thin lines have
+        # no area. Every piece is widened by half a pixel before joining and
+        # narrowed back afterwards.
+        widened = []
+        for cnt in pieces:
+            coords = cnt.reshape(-1, 2).astype(np.float64)
+
+            if len(coords) == 1:
+                widened.append(shapely.points(coords[0]).buffer(0.5, quad_segs=2))
+                continue
+
+            piece = LineString(np.vstack((coords, coords[:1]))).buffer(0.5, quad_segs=2)
+            if len(coords) >= 3:
+                piece = shapely.union(piece, shapely.make_valid(Polygon(coords)))
+
+            widened.append(piece)
+
+        joined = shapely.get_parts(shapely.union_all(widened))
+        filled = [Polygon(part.exterior) for part in joined if isinstance(part, Polygon)]
+
+        # Narrowed a little less than widened, so pixels touching only
+        # diagonally stay joined, like they do in contours of the whole image
+        narrowed = shapely.get_parts(shapely.buffer(filled, -0.49, quad_segs=2))
+
+        exteriors = [Polygon(part.exterior) for part in narrowed
+                     if isinstance(part, Polygon) and not part.is_empty]
+        if len(exteriors) == 0:
+            return self.sort_contours(contours)
+
+        # Contours inside another contour
+        tree = shapely.STRtree(exteriors)
+        starts = shapely.points([cnt.reshape(-1, 2)[0] for cnt in contours] +
+                                [exterior.exterior.coords[0] for exterior in exteriors])
+
+        nested = np.zeros(len(starts), dtype=bool)
+        nested[tree.query(starts, predicate="within")[0]] = True
+
+        kept = [cnt for cnt, inside in zip(contours, nested) if not inside]
+
+        # Joined contours get pixel steps again, like contours of single tiles
+        for exterior, inside in zip(exteriors, nested[len(contours):]):
+            if not inside:
+                coords = self.pixel_steps(shapely.get_coordinates(exterior.exterior)[:-1])
+                kept.append(coords.astype(np.int32).reshape(-1, 1, 2))
+
+        return self.sort_contours(kept)
+
+    def pixel_steps(self, coords):
+        """
+            INTERNAL FUNCTION!
+
+            Snap a joined contour back onto centres of pixels and return it
+            the way OpenCV traces outer contours, in steps between
+            neighbouring pixels, starting at its topmost (then leftmost) pixel.
+        """
+
+        coords = np.rint(coords).astype(np.int64)
+        if np.all(coords == coords[0]):
+            return coords[:1]
+
+        coords = self.remove_repeated(coords)
+
+        # Edges of joined pixels are straight or diagonal, so they are filled
+        # in with single pixel steps
+        steps = np.roll(coords, -1, axis=0) - coords
+        counts = np.maximum(np.abs(steps).max(axis=1), 1)
+
+        edge = np.repeat(np.arange(len(coords)), counts)
+        fraction = (np.arange(len(edge)) - np.repeat(np.cumsum(counts) - counts, counts)) / counts[edge]
+        coords = np.rint(coords[edge] + steps[edge] * fraction[:, None]).astype(np.int64)
+        coords = self.remove_repeated(coords)
+
+        # Outer contours of OpenCV have negative area in pixel coordinates
+        x, y = coords.T
+        if np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y) > 0:
+            coords = coords[::-1]
+
+        start = np.lexsort((coords[:, 0], coords[:, 1]))[0]
+        return np.roll(coords, -start, axis=0)
+
+    def sort_contours(self, contours):
+        """
+            INTERNAL FUNCTION!
+
+            Sort contours the way OpenCV returns contours of the whole image,
+            from the last to the first start point in raster order. Order of
+            elements decides which coordinates and depth a polygon gets.
+        """
+
+        starts = np.array([cnt.reshape(-1, 2)[0] for cnt in contours]).reshape(-1, 2)
+        order = np.lexsort((starts[:, 0], starts[:, 1]))[::-1]
+
+        return [contours[i] for i in order]
+
     def contours_to_shapely(self, contours, image_height, min_area=0):
         """
             INTERNAL FUNCTION!
@@ -137,6 +632,7 @@ class Image:
             Convert OpenCV contours to the Shapely geometry.
         """
 
+        elements = []
         for cnt in contours:
             if cv2.contourArea(cnt) < min_area:
                 continue
@@ -144,10 +640,13 @@ class Image:
             coords = cnt.reshape(-1, 2)
 
             # Detect closed contour
-            if np.linalg.norm(coords[0] - coords[-1]) <= 2:
+            closed = np.linalg.norm(coords[0] - coords[-1]) <= 2
+            coords = self.reduce_contour(coords, closed)
+
+            if closed:
 
                 if self.remove_colinear:
-                    geom = Polygon(self.remove_collinear_2d(coords))
+                    geom = Polygon(self.remove_collinear(coords, True))
                 
                 else:
                     geom = Polygon(coords)
@@ -155,67 +654,172 @@ class Image:
             else:
                 geom = LineString(coords)
 
-            if self.flip_y == True:
-                geom = self.flip_y_function(geom, image_height)
+            elements.append(geom)
+
+        if len(elements) == 0:
+            return elements
 
-            if self.simplify_tolerance > 0:
-                geom = geom.simplify(self.simplify_tolerance, preserve_topology=True)
+        # Coordinates of all elements are flipped and simplified at once
+        if self.flip_y == True:
+            elements = self.flip_y_function(elements, image_height)
 
-            self.elements.append(geom)
+        if self.simplify_tolerance > 0:
+            elements = shapely.simplify(elements, self.simplify_tolerance, preserve_topology=True)
 
-    def flip_y_function(self, geom, height):
+        return list(elements)
+
+    def reduce_contour(self, coords, closed):
         """
             INTERNAL FUNCTION!
 
-            Flip an element by 180 degrees on Y axis.
+            Reduce vertices of a contour with steps of `self.contour_reduction`.
         """
 
-        if isinstance(geom, Polygon):
-            # Flip exterior ring
-            exterior = [(x, height - y) for x, y in geom.exterior.coords]
+        for step in self.contour_reduction:
+            match step:
+                case "chain":
+                    reduced = self.merge_runs(coords, closed)
 
-            # Flip interior rings (holes)
-            interiors = [
-                [(x, height - y) for x, y in interior.coords]
-                for interior in geom.interiors
-            ]
+                case "collinear":
+                    reduced = self.remove_collinear(coords, closed)
 
-            return Polygon(exterior, interiors)
+                case "douglas_peucker":
+                    reduced = cv2.approxPolyDP(np.rint(coords).reshape(-1, 1, 2).astype(np.int32),
+                                               self.reduction_tolerance, bool(closed)).reshape(-1, 2)
 
-        elif isinstance(geom, LineString):
-            return LineString([(x, height - y) for x, y in geom.coords])
+            # Keep contours which would degenerate
+            if len(reduced) >= (3 if closed else 2):
+                coords = reduced
 
-        else:
-            raise TypeError(f"[EXTRACTOR-IMAGE] Unsupported geometry type: {type(geom)}")
+        return coords
 
-    def remove_collinear_2d(self, coords):
+    def merge_runs(self, coords, closed):
         """
             INTERNAL FUNCTION!
 
-            Remove collinear points from a 2D polygon.
+            Remove vertices in the middle of straight runs of a pixel contour
+            (chain compression), a vertex is removed when the step into it
+            equals the step out of it. Duplicate vertices are removed.
         """
 
         if len(coords) < 3:
             return coords
 
-        simplified = [coords[0]]
-        
-        for i in range(1, len(coords) - 1):
-            x1, y1 = simplified[-1]
-            x2, y2 = coords[i]
-            x3, y3 = coords[i+1]
+        # Steps into and out of every vertex, closed contours wrap around
+        step_in = coords - np.roll(coords, 1, axis=0)
+        step_out = np.roll(coords, -1, axis=0) - coords
+
+        straight = np.all(step_in == step_out, axis=1)
+        straight |= np.all(step_in == 0, axis=1)
+
+        # Ends of an open contour always stay
+        if not closed:
+            straight[0] = False
+            straight[-1] = False
+
+        return coords[~straight]
+
+    def flip_y_function(self, geoms, height):
+        """
+            INTERNAL FUNCTION!
+
+            Flip elements by 180 degrees on Y axis, exteriors and interiors
+            (holes) of all elements in a single coordinate transform.
+        """
+
+        return shapely.transform(geoms, lambda coords: coords * [1, -1] + [0, height])
+
+    def remove_collinear(self, coords, closed):
+        """
+            INTERNAL FUNCTION!
+
+            Remove collinear vertices of a contour, used by the `collinear`
+            reduction step and `remove_colinear`.
+
+            Every vertex is checked against its neighbours in the contour
+            (not against previously kept vertices), so the result does not
+            depend on the order of vertices. Tips of zero-width spikes are
+            collinear with their neighbours too, so they are removed as well,
+            and checks are repeated until no vertex is removed, as a removed
+            spike might leave a collinear vertex behind. Ends of an open
+            contour always stay.
+        """
+
+        coords = np.asarray(coords)
+        if len(coords) < 3:
+            return coords
+
+        simplified = self.remove_repeated(coords, closed)
 
-            # Check if points are collinear
-            if (y2 - y1)*(x3 - x2) != (y3 - y2)*(x2 - x1):
-                simplified.append(coords[i])
+        while len(simplified) >= 3:
+            # Steps into and out of every vertex, closed contours wrap around
+            step_in = simplified - np.roll(simplified, 1, axis=0)
+            step_out = np.roll(simplified, -1, axis=0) - simplified
+
+            cross = step_in[:, 0] * step_out[:, 1] - step_in[:, 1] * step_out[:, 0]
+            lengths = np.hypot(step_in[:, 0], step_in[:, 1]) * np.hypot(step_out[:, 0], step_out[:, 1])
+
+            keep = np.abs(cross) > COLLINEAR_TOLERANCE * lengths
+            if not closed:
+                keep[0] = True
+                keep[-1] = True
+
+            if np.all(keep):
+                break
+
+            # Removed spikes leave repeated vertices behind
+            simplified = self.remove_repeated(simplified[keep], closed)
+
+        # Keep contours which would degenerate
+        if len(simplified) < (3 if closed else 2):
+            return coords
 
-        simplified.append(coords[-1])
         return simplified
 
+    def remove_repeated(self, coords, closed=True):
+        """
+            INTERNAL FUNCTION!
+
+            Remove vertices repeating the previous vertex of a contour, the
+            first vertex of a closed contour follows its last one.
+        """
+
+        if len(coords) < 2:
+            return coords
+
+        repeated = np.all(coords == np.roll(coords, 1, axis=0), axis=1)
+        if not closed:
+            repeated[0] = False
+
+        return coords[~repeated]
+
     ###########################################################################
     #####                                                                 #####
     ###########################################################################
 
+    def check_coarse_contours(self, contours, binary):
+        """
+            DEBUG FUNCTION!
+
+            Compare contours found on the coarse pyramid level with contours
+            of the whole image, they must match in the same order.
+        """
+
+        expected, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+
+        if len(expected) != len(contours):
+            print(f"[EXTRACTOR-IMAGE-DEBUG] Coarse search found {len(contours)} contours," +
+                  f" whole image has {len(expected)}!")
+            return
+
+        for i, (cnt, reference) in enumerate(zip(contours, expected)):
+            if not np.array_equal(cnt, reference):
+                print(f"[EXTRACTOR-IMAGE-DEBUG] Contour {i} of the coarse search does not" +
+                      " match the whole image!")
+                return
+
+        print(f"[EXTRACTOR-IMAGE-DEBUG] Coarse search matches the whole image ({len(contours)} contours).")
+
     def visualize(self, image, binary, contours, MIN_CONTOUR_AREA):
         """
             DEBUG FUNCTION!
@@ -0,0 +1,278 @@
+# AUTHOR Andrej Bartulin
+# PROJECT: B.A.G.E.R. parser
+# LICENSE: Polyform Shield License 1.0.0
+# DESCRIPTION: ESRI Shapefile reader
+
+import mmap
+import numpy as np
+import os
+import shapely
+from shapely.geometry import Polygon
+
+# Shape types holding polylines and polygons, plain and with Z or M values
+POLYLINE_TYPES = (3, 13, 23)
+POLYGON_TYPES = (5, 15, 25)
+
+FILE_CODE = 9994
+HEADER_SIZE = 100
+
+# Number of records decoded at once
+BLOCK_SIZE = 16384
+
+class ShapefileReader:
+    """
+        Read polylines and polygons of an ESRI Shapefile (`.shp` with its `.shx`).
+
+        `.shp` file is memory-mapped and records are located through `.shx`
+        offsets. Bounding boxes of all records are read at once, so records
+        outside `bbox` are skipped before their coordinates are touched.
+        Coordinates of kept records are decoded straight from the mapped file
+        into NumPy arrays and turned into Shapely geometry in bulk.
+        Z and M values are ignored.
+
+        :param str path: path to the `.shp` file
+        :param tuple bbox: (min_x, min_y, max_x, max_y) area to read, None reads everything
+    """
+
+    def __init__(self, path, bbox=None):
+        """
+            Initialize variables.
+        """
+
+        self.path = path
+        self.bbox = bbox
+
+    def geometries(self):
+        """
+            Return Shapely geometry of all polyline and polygon records.
+        """
+
+        with open(self.path, "rb") as file:
+            if os.path.getsize(self.path) <= HEADER_SIZE:
+                return []
+
+            # Mapping is released together with the last array viewing it
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            return self.read_records(np.frombuffer(data, dtype=np.uint8))
+
+    ###########################################################################
+    #####                                                                 #####
+    ###########################################################################
+
+    def read_records(self, data):
+        """
+            INTERNAL FUNCTION!
+
+            Decode records of the mapped `.shp` file.
+        """
+
+        if int(data[:4].view(">i4")[0]) != FILE_CODE:
+            raise ValueError(f"[EXTRACTOR-SHAPEFILE] '{self.path}' is not a shapefile!")
+
+        offsets = self.get_record_offsets(data)
+
+        # Shape type and bounding box of every record, without touching points
+        content = offsets + 8
+        content = content[content + 44 <= len(data)]
+        head = self.gather(data, content, 36)
+
+        shape_types = head[:, :4].copy().view("<i4")[:, 0]
+        boxes = head[:, 4:].copy().view("<f8")
+
+        keep = np.isin(shape_types, POLYLINE_TYPES + POLYGON_TYPES)
+        if self.bbox != None:
+            min_x, min_y, max_x, max_y = self.bbox
+            keep &= ((boxes[:, 0] <= max_x) & (boxes[:, 2] >= min_x) &
+                     (boxes[:, 1] <= max_y) & (boxes[:, 3] >= min_y))
+
+        content = content[keep]
+        shape_types = shape_types[keep]
+
+        # Records are decoded in blocks, so temporary arrays stay small
+        geometries = []
+        for block in range(0, len(content), BLOCK_SIZE):
+            geometries.extend(self.read_block(data, content[block:block + BLOCK_SIZE],
+                                              shape_types[block:block + BLOCK_SIZE]))
+
+        return geometries
+
+    def read_block(self, data, content, shape_types):
+        """
+            INTERNAL FUNCTION!
+
+            Decode a block of records, `content` holds offsets of their contents.
+        """
+
+        # Number of parts and points of every kept record
+        counts = self.gather(data, content + 36, 8).view("<i4")
+        part_counts = counts[:, 0].astype(np.int64)
+        point_counts = counts[:, 1].astype(np.int64)
+
+        part_starts = content + 44
+        point_starts = part_starts + 4 * part_counts
+
+        # Indices of the first point of every part, relative to the record
+        parts = np.concatenate([data[start:start + 4 * count].view("<i4")
+                                for start, count in zip(part_starts, part_counts)])
+
+        coords = np.concatenate([data[start:start + 16 * count].view("<f8").reshape(-1, 2)
+                                 for start, count in zip(point_starts, point_counts)])
+
+        # Number every part and find the part each point belongs to
+        record_of_part = np.repeat(np.arange(len(content)), part_counts)
+        first_point = np.cumsum(point_counts) - point_counts
+        part_begin = first_point[record_of_part] + parts
+        part_end = np.append(part_begin[1:], len(coords))
+
+        has_parts = part_counts > 0
+        record_last_part = np.cumsum(part_counts) - 1
+        part_end[record_last_part[has_parts]] = (first_point + point_counts)[has_parts]
+
+        part_lengths = part_end - part_begin
+        if np.any(part_lengths < 0) or part_lengths.sum() != len(coords):
+            raise ValueError(f"[EXTRACTOR-SHAPEFILE] Malformed parts of a record in '{self.path}'!")
+
+        valid = part_lengths >= 2
+        part_index = np.repeat(np.arange(len(part_begin)), np.maximum(part_lengths, 0))
+
+        polygon_part = np.isin(shape_types, POLYGON_TYPES)[record_of_part]
+
+        lines, line_parts = self.build_lines(coords, part_index, valid & ~polygon_part)
+        polygons, polygon_parts = self.build_polygons(coords, part_index, part_lengths,
+                                                      valid & polygon_part, record_of_part)
+
+        # Keep the order of records in the file
+        geometries = lines + polygons
+        order = np.argsort(np.concatenate((line_parts, polygon_parts)), kind="stable")
+
+        return [geometries[i] for i in order]
+
+    def get_record_offsets(self, data):
+        """
+            INTERNAL FUNCTION!
+
+            Return byte offsets of all records, read from the `.shx` file or
+            found by walking the `.shp` file when there is no `.shx` file.
+        """
+
+        index_path = os.path.splitext(self.path)[0] + ".shx"
+        for candidate in (index_path, index_path[:-4] + ".SHX"):
+            if os.path.exists(candidate):
+                index = np.fromfile(candidate, dtype=">i4", offset=HEADER_SIZE)
+                return index[0::2].astype(np.int64) * 2
+
+        print(f"[EXTRACTOR-SHAPEFILE] Index file '{index_path}' does not exist," +
+              " walking through all records.")
+
+        offsets = []
+        offset = HEADER_SIZE
+        while offset + 8 <= len(data):
+            offsets.append(offset)
+            offset += 8 + 2 * int(data[offset + 4:offset + 8].view(">i4")[0])
+
+        return np.array(offsets, dtype=np.int64)
+
+    def gather(self, data, starts, length):
+        """
+            INTERNAL FUNCTION!
+
+            Copy `length` bytes from every offset in `starts` into rows of
+            an array, a block of rows at a time to keep index arrays small.
+        """
+
+        out = np.empty((len(starts), length), dtype=np.uint8)
+        columns = np.arange(length)
+
+        for block in range(0, len(starts), 65536):
+            rows = starts[block:block + 65536]
+            out[block:block + len(rows)] = data[rows[:, None] + columns]
+
+        return out
+
+    def select_parts(self, coords, part_index, selected):
+        """
+            INTERNAL FUNCTION!
+
+            Return points of selected parts and index of their part,
+            numbered from 0 among selected parts.
+        """
+
+        number = np.cumsum(selected) - 1
+
+        if np.all(selected):
+            return (coords, number[part_index])
+
+        points = selected[part_index]
+        return (coords[points], number[part_index[points]])
+
+    def build_lines(self, coords, part_index, selected):
+        """
+            INTERNAL FUNCTION!
+
+            Build a LineString from every selected polyline part.
+            Returns the lines and parts they were built from.
+        """
+
+        if not np.any(selected):
+            return ([], np.array([], dtype=np.int64))
+
+        coords, indices = self.select_parts(coords, part_index, selected)
+        lines = shapely.linestrings(coords, indices=indices)
+
+        return (list(lines), np.flatnonzero(selected))
+
+    def build_polygons(self, coords, part_index, part_lengths, selected, record_of_part):
+        """
+            INTERNAL FUNCTION!
+
+            Build polygons from selected polygon parts (rings). Clockwise rings
+            are outer rings, counter-clockwise ones are holes of the outer ring
+            of the same record containing them.
+            Returns the polygons and first parts they were built from.
+        """
+
+        selected = selected & (part_lengths >= 4)
+        if not np.any(selected):
+            return ([], np.array([], dtype=np.int64))
+
+        coords, indices = self.select_parts(coords, part_index, selected)
+        rings = shapely.linearrings(coords, indices=indices)
+        ring_parts = np.flatnonzero(selected)
+        records = record_of_part[selected]
+        outer = ~shapely.is_ccw(rings)
+
+        # Records of a single outer ring and no holes, the common case
+        ring_counts = np.bincount(records)
+        simple = (ring_counts[records] == 1) & outer
+
+        polygons = list(shapely.polygons(rings[simple]))
+        polygon_parts = list(ring_parts[simple])
+
+        # Rings of the remaining records are grouped one record at a time
+        rest = np.flatnonzero(~simple)
+        boundaries = np.flatnonzero(np.diff(records[rest])) + 1
+        for group in np.split(rest, boundaries):
+            if len(group) == 0:
+                continue
+
+            shells = [ring for ring, is_outer in zip(rings[group], outer[group]) if is_outer]
+            holes = [ring for ring, is_outer in zip(rings[group], outer[group]) if not is_outer]
+
+            if len(shells) == 0:
+                # Wrongly oriented rings, treat them as outer rings
+                shells, holes = holes, []
+
+            shell_holes = [[] for _ in shells]
+            for hole in holes:
+                x, y = shapely.get_coordinates(hole)[0]
+
+                for i, shell in enumerate(shells):
+                    if len(shells) == 1 or shapely.contains_xy(shapely.polygons(shell), x, y):
+                        shell_holes[i].append(hole)
+                        break
+
+            for shell, hole_rings in zip(shells, shell_holes):
+                polygons.append(Polygon(shell, hole_rings))
+                polygon_parts.append(ring_parts[group[0]])
+
+        return (polygons, np.array(polygon_parts, dtype=np.int64))
@@ -0,0 +1,55 @@
+# AUTHOR Andrej Bartulin
+# PROJECT: B.A.G.E.R. parser
+# LICENSE: Polyform Shield License 1.0.0
+# DESCRIPTION: Tessellation of curved entities
+
+import math
+import numpy as np
+
+# Number of segments used when no chord tolerance is given
+DEFAULT_SEGMENTS = 64
+
+# Upper limit of segments of a single curve, guards against tiny tolerances
+MAX_SEGMENTS = 4096
+
+def segment_count(radius, sweep, chord_tolerance, minimum=1):
+    """
+        Return number of segments needed to approximate an arc so that no
+        chord is further than `chord_tolerance` from the arc.
+
+        Chord of an arc spanning angle `a` deviates from it by the sagitta
+        `radius * (1 - cos(a / 2))`, largest angle which keeps it within
+        tolerance gives the segment count.
+
+        :param float radius: radius of the arc
+        :param float sweep: swept angle in radians
+        :param float chord_tolerance: maximum chord error, 0 uses `DEFAULT_SEGMENTS`
+        :param int minimum: smallest number of segments returned
+    """
+
+    if chord_tolerance <= 0:
+        return DEFAULT_SEGMENTS
+
+    sweep = abs(sweep)
+    if radius <= chord_tolerance or sweep == 0:
+        return minimum
+
+    step = 2 * math.acos(1 - chord_tolerance / radius)
+    count = math.ceil(sweep / step - 1e-9)
+
+    return int(min(max(count, minimum), MAX_SEGMENTS))
+
+def arc_points(center, radius, start, end, segments):
+    """
+        Return (N, 2) array of points along a circular arc, endpoints included.
+
+        :param tuple center: center of the arc
+        :param float radius: radius of the arc
+        :param float start: start angle in radians
+        :param float end: end angle in radians
+        :param int segments: number of segments
+    """
+
+    angles = np.linspace(start, end, segments + 1)
+    return np.column_stack((center[0] + radius * np.cos(angles),
+                            center[1] + radius * np.sin(angles)))
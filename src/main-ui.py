@@ -14,6 +14,7 @@ import sys
 import toml
 
 from embedder.embedder import *
+from extractor.cache import *
 from extractor.dxf import *
 from extractor.gis import *
 from extractor.image import *
@@ -37,40 +38,65 @@ def merge_dicts(d1, d2):
         else:
             d1[key] = value
 
-def parse_section(parsed_toml, section_name):
+def parse_section(parsed_toml, section_name, extractions=None):
     """
         Parse (run extractor, separator, positioner and embedder) a TOML section.
         
         :param dict parsed_toml: parsed contents of the TOML file
         :param str section_name: name of the section to be parsed 
+        :param SharedExtractions extractions: elements already extracted by other sections of this run
     """
 
     extractor = None
 
+    # Extracted elements of unchanged files are loaded from disk
+    cache = None
+    if parsed_toml[section_name].get('cache', True) == True:
+        cache = ExtractorCache()
+
     match parsed_toml[section_name]['parser_type']:
         case "dxf":
-            extractor = DXF(parsed_toml[section_name]['path'])
+            extractor = DXF(parsed_toml[section_name]['path'],
+                            parsed_toml[section_name].get('chord_tolerance', 0.0),
+                            parsed_toml[section_name].get('streaming', False),
+                            parsed_toml[section_name].get('layers', []),
+                            parsed_toml[section_name].get('bbox', []),
+                            cache)
 
         case "image":
             extractor = Image(parsed_toml[section_name]['path'],
                               parsed_toml[section_name]['debug'],
                               parsed_toml[section_name]['flip_y'],
                               parsed_toml[section_name]['simplify_tolerance'],
-                              parsed_toml[section_name]['remove_colinear'])
+                              parsed_toml[section_name]['remove_colinear'],
+                              parsed_toml[section_name].get('contour_reduction', []),
+                              parsed_toml[section_name].get('reduction_tolerance', 1.0),
+                              parsed_toml[section_name].get('tile_size', 0),
+                              parsed_toml[section_name].get('coarse_level', 0),
+                              parsed_toml[section_name].get('workers', 1),
+                              cache)
 
         case "GIS":
-            extractor = GIS(parsed_toml[section_name]['path'])
+            extractor = GIS(parsed_toml[section_name]['path'],
+                            parsed_toml[section_name].get('layers', []),
+                            parsed_toml[section_name].get('bbox', []),
+                            cache)
 
         case _:
             pass
 
     if extractor != None:
-        extractor.extract_entities()
-        elements = extractor.get_elements()
+        if extractions != None:
+            elements = extractions.get_elements(extractor)
+
+        else:
+            extractor.extract_entities()
+            elements = extractor.get_elements()
 
         separator = Separator(elements, parsed_toml[section_name]['debug'],
                               parsed_toml[section_name]['grid_size'],
-                              parsed_toml[section_name]['min_spacing'])
+                              parsed_toml[section_name]['min_spacing'],
+                              parsed_toml[section_name].get('snap_tolerance', 0.0))
         separator.execute()
         polygons, grids = separator.get_shapes()
 
@@ -168,10 +194,13 @@ class MainWindow(QWidget):
         
         window.hide()
 
+        # Sections reading the same file share its extraction
+        extractions = SharedExtractions()
+
         # Loop through each TOML section and parse it
         for key, value in parsed_toml.items():
             if isinstance(value, dict):
-                parse_section(parsed_toml, key)
+                parse_section(parsed_toml, key, extractions)
 
 if __name__ == "__main__":
     config_path: str = ""
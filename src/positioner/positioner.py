@@ -4,8 +4,7 @@
 # DESCRIPTION: Positioner
 
 import numpy as np
-from shapely import affinity
-from shapely.geometry import Polygon
+import shapely
 
 class Positioner:
     """
@@ -37,6 +36,10 @@ class Positioner:
     def execute(self):
         """
             Transform polygons.
+
+            Coordinates transformation and scale are composed into a single
+            matrix per polygon, which is applied to all points of polygons
+            and divisions at once, together with adding depth.
         """
         
         #########################################
@@ -44,16 +47,11 @@ class Positioner:
         #########################################
 
         if len(self.coords) == len(self.polygons):
-            for i, polygon in enumerate(self.polygons):
-                transformed_poly, affine_matrix = self.transform_polygon(polygon, self.coords[i])
-                self.transformed_polygons.append(transformed_poly)
-
-                transformed_divs = self.transform_divisions(self.divisions[i], affine_matrix)
-                self.transformed_divisions.append(transformed_divs)
+            matrices = [self.get_affine_matrix(polygon, self.coords[i])
+                        for i, polygon in enumerate(self.polygons)]
 
         else:
-            self.transformed_polygons = self.polygons
-            self.transformed_divisions = self.divisions
+            matrices = [np.eye(2, 3) for _ in self.polygons]
 
             # If array length is zero, we assume user intentionally
             # does not want to change coordinates and we do not
@@ -70,24 +68,13 @@ class Positioner:
         if self.scale == 0.0:
             self.scale = 1.0
 
-        self.transformed_polygons = [
-            affinity.scale(poly, xfact=self.scale, yfact=self.scale, origin=(0, 0))
-            for poly in self.transformed_polygons
-        ]
-
-        self.transformed_divisions = [
-            [
-                affinity.scale(line, xfact=self.scale, yfact=self.scale, origin=(0, 0))
-                for line in division
-            ]
-            for division in self.transformed_divisions
-        ]
+        matrices = np.array(matrices, dtype=float).reshape(-1, 2, 3) * self.scale
 
         #########################################
         # Add depth
         #########################################
 
-        if len(self.depth_array) != len(self.transformed_polygons):
+        if len(self.depth_array) != len(self.polygons):
             # If array length is zero, we assume user intentionally 
             # does not want to change depth and we do not need to
             # print an error message
@@ -97,12 +84,11 @@ class Positioner:
                       " polygons to zero.")
 
             self.depth_array = []
-            for i in range(len(self.transformed_polygons)):
+            for i in range(len(self.polygons)):
                 self.depth_array.append(0)
 
-        for i, poly in enumerate(self.transformed_polygons):
-            transformed_poly = Polygon([(x, y, self.depth_array[i]) for x, y in poly.exterior.coords])
-            self.transformed_polygons[i] = transformed_poly
+        self.transformed_polygons = self.transform_polygons(matrices)
+        self.transformed_divisions = self.transform_divisions(matrices)
 
     def get_elements(self):
         """
@@ -115,25 +101,85 @@ class Positioner:
     #####                                                                 #####
     ###########################################################################
 
-    def transform_divisions(self, lines, M):
+    def transform_polygons(self, matrices):
+        """
+            INTERNAL FUNCTION!
+
+            Transform exteriors of all polygons with their matrices and
+            add their depth as Z coordinate.
+        """
+
+        if len(self.polygons) == 0:
+            return []
+
+        exteriors = shapely.get_exterior_ring(np.array(self.polygons, dtype=object))
+        coords, index = shapely.get_coordinates(exteriors, return_index=True)
+
+        coords = self.apply_matrices(coords, matrices[index])
+        depth = np.asarray(self.depth_array, dtype=float)[index]
+
+        # Empty polygons have no coordinates, they keep empty rings, so
+        # polygons still match their depth and divisions
+        rings = np.full(len(exteriors), shapely.LinearRing(), dtype=object)
+        shapely.linearrings(np.column_stack((coords, depth)), indices=index, out=rings)
+
+        return list(shapely.polygons(rings))
+
+    def transform_divisions(self, matrices):
         """
             INTERNAL FUNCTION!
 
-            Transform divisions of the polygon using the same affine matrix
-            used in polygon transformation.
+            Transform lines (divisions) of every polygon using the same
+            matrix used in polygon transformation.
         """
 
-        a, b, tx = M[0]
-        d, e, ty = M[1]
-        affine_params = [a, b, d, e, tx, ty]
+        divisions = [list(division) for division in self.divisions]
 
-        return [affinity.affine_transform(line, affine_params) for line in lines]
+        # Divisions which do not belong to a polygon are only scaled
+        if len(divisions) > len(matrices):
+            extra = np.tile(np.eye(2, 3) * self.scale, (len(divisions) - len(matrices), 1, 1))
+            matrices = np.concatenate((matrices, extra))
 
-    def transform_polygon(self, polygon, toml_coords, int_tol=1e-4, dec_places=6):
+        lines = np.array([line for division in divisions for line in division], dtype=object)
+        if len(lines) == 0:
+            return divisions
+
+        # Polygon (matrix) every line belongs to
+        owners = np.repeat(np.arange(len(divisions)), [len(division) for division in divisions])
+
+        coords, index = shapely.get_coordinates(lines, return_index=True)
+        coords = self.apply_matrices(coords, matrices[owners[index]])
+
+        # Lines are shared with the Separator (and cached extractions), so
+        # new lines are created instead of changing their coordinates,
+        # empty lines stay empty
+        lines = np.full(len(lines), shapely.LineString(), dtype=object)
+        shapely.linestrings(coords, indices=index, out=lines)
+
+        transformed = []
+        start = 0
+        for division in divisions:
+            transformed.append(list(lines[start:start + len(division)]))
+            start += len(division)
+
+        return transformed
+
+    def apply_matrices(self, coords, matrices):
         """
             INTERNAL FUNCTION!
 
-            Transform polygon coordinates using affine transformation.
+            Apply a 2x3 affine matrix to every point, `matrices` holds
+            a matrix for every point.
+        """
+
+        return np.einsum("nij,nj->ni", matrices[:, :, :2], coords) + matrices[:, :, 2]
+
+    def get_affine_matrix(self, polygon, toml_coords, int_tol=1e-4, dec_places=6):
+        """
+            INTERNAL FUNCTION!
+
+            Return 2x3 affine matrix moving first points of the polygon
+            onto coordinates from the TOML file.
         """
 
         src_coords = list(polygon.exterior.coords)
@@ -180,8 +226,5 @@ class Positioner:
                 p[i] = np.round(coef, dec_places)
 
         a, b_, d, e, tx, ty = p
-        M = np.array([[a, b_, tx],
-                    [d, e, ty]], dtype=float)
-
-        transformed = affinity.affine_transform(polygon, [a, b_, d, e, tx, ty])
-        return transformed, M
+        return np.array([[a, b_, tx],
+                         [d, e, ty]], dtype=float)
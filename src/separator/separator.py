@@ -3,9 +3,9 @@
 # LICENSE: Polyform Shield License 1.0.0
 # DESCRIPTION: Separator
 
-from collections import defaultdict
 import matplotlib.pyplot as plt
 import numpy as np
+import shapely
 from shapely.geometry import LineString, MultiPolygon, Polygon
 
 class Separator:
@@ -16,9 +16,10 @@ class Separator:
         :param bool debug: is debug mode on
         :param int grid_size: size of the grid
         :param float min_spacing: minimum spacing between two lines in a grid
+        :param float snap_tolerance: maximum distance between two joined line endpoints
     """
 
-    def __init__(self, elements, debug, grid_size, min_spacing):
+    def __init__(self, elements, debug, grid_size, min_spacing, snap_tolerance=0.0):
         """
             Initialize variables.
         """
@@ -40,6 +41,9 @@ class Separator:
         # Variable holding minimal spacing in curved segments
         self.min_spacing = min_spacing
 
+        # Variable holding distance under which line endpoints are joined
+        self.snap_tolerance = snap_tolerance
+
     def execute(self):
         """
             Separate and divide.
@@ -84,19 +88,16 @@ class Separator:
             y_combined = np.unique(np.concatenate((y_grid, y_breaks)))
             y_combined.sort()
 
-            # 4) Generate and clip horizontal lines
-            clipped_lines = []
-            for y in y_combined:
-                line = LineString([(min_x, y), (max_x, y)])
-                intersection = polygon.intersection(line)
-                if not intersection.is_empty:
-                    if intersection.geom_type == "LineString":
-                        clipped_lines.append(intersection)
-                    elif intersection.geom_type == "MultiLineString":
-                        clipped_lines.extend(intersection.geoms)
+            # 4) Clip horizontal lines to the polygon in a single pass
+            rows, x_start, x_end = self.scanline_intervals(polygon, y_combined)
+
+            segments = np.empty((len(rows), 2, 2))
+            segments[:, 0, 0] = x_start
+            segments[:, 1, 0] = x_end
+            segments[:, :, 1] = y_combined[rows, None]
 
             # Store result
-            self.divisions.append(clipped_lines)
+            self.divisions.append(list(shapely.linestrings(segments)))
 
     def create_polygons(self):
         """
@@ -133,111 +134,352 @@ class Separator:
     #####                                                                 #####
     ###########################################################################
 
-    def build_adjacency(self, lines):
+    def build_adjacency(self, nodes, endpoints):
         """
             INTERNAL FUNCTION!
 
-            Build an adjacency list mapping each endpoint to connected lines and
-            their opposite endpoints.
+            Build half-edges of all segments, half-edge `2 * i` walks segment `i`
+            from its first to its last node and `2 * i + 1` walks it back.
+
+            Returns the node each half-edge starts in and the half-edge which
+            follows it around the face on its left side.
         """
 
-        adj = defaultdict(list)
-        for idx, line in enumerate(lines):
-            p1r = self.round_point(tuple(line.coords[0]))
-            p2r = self.round_point(tuple(line.coords[-1]))
+        origin = endpoints.reshape(-1)
+        target = endpoints[:, ::-1].reshape(-1)
+
+        # Sort outgoing half-edges of every node counter-clockwise by angle
+        delta = nodes[target] - nodes[origin]
+        angle = np.arctan2(delta[:, 1], delta[:, 0])
+        order = np.lexsort((angle, origin))
+
+        position = np.empty_like(order)
+        position[order] = np.arange(len(order))
+
+        first = np.searchsorted(origin[order], origin)
+        count = np.bincount(origin, minlength=len(nodes))[origin]
 
-            adj[p1r].append((idx, p2r))
-            adj[p2r].append((idx, p1r))
+        # After arriving in a node, leave through the next edge clockwise
+        # from the one we came along
+        twin = np.arange(len(origin)) ^ 1
+        next_half_edge = order[first[twin] + (position[twin] - first[twin] - 1) % count[twin]]
 
-        return adj
+        return (origin, next_half_edge)
 
     def canonical_ring_key(self, coords):
         """
             INTERNAL FUNCTION!
 
             Get canonical form of ring to avoid duplicates.
+
+            Canonical form is the smallest rotation of the ring in either
+            direction, found in O(n) time.
         """
 
         coords = coords[:-1] if coords[0] == coords[-1] else coords
-        n = len(coords)
+        coords_rev = coords[::-1]
 
-        rotations = [tuple(coords[i:] + coords[:i]) for i in range(n)]
-        rotations_rev = [tuple(reversed(r)) for r in rotations]
+        i = self.least_rotation(coords)
+        j = self.least_rotation(coords_rev)
 
-        return min(rotations + rotations_rev)
+        return min(tuple(coords[i:] + coords[:i]), tuple(coords_rev[j:] + coords_rev[:j]))
 
-    def find_polygons(self, lines):
+    def find_polygons(self, segments):
         """
             INTERNAL FUNCTION!
 
-            Find all closed, non intersecting polygons in array of `LineString` objects.
+            Find all closed, non intersecting polygons in an array of segments.
+
+            Segments form a planar graph of half-edges. Outgoing half-edges of
+            every node are sorted by angle and bounded faces are walked by always
+            turning to the next edge clockwise, which is O(E log E) in total.
         """
 
-        # Ensure lines are LineStrings
-        adj = self.build_adjacency(lines)
+        nodes, endpoints = self.snap_endpoints(segments)
+
+        # Zero-length segments can not be part of any face
+        endpoints = endpoints[endpoints[:, 0] != endpoints[:, 1]]
+
+        origin, next_half_edge = self.build_adjacency(nodes, endpoints)
+        origin = origin.tolist()
+        next_half_edge = next_half_edge.tolist()
+
+        # Walk every face exactly once, face is always on the left side
+        visited = [False] * len(origin)
+        rings = []
+        for start in range(len(origin)):
+            if visited[start]:
+                continue
+
+            walk = []
+            half_edge = start
+            while not visited[half_edge]:
+                visited[half_edge] = True
+                walk.append(half_edge)
+                half_edge = next_half_edge[half_edge]
+
+            rings.extend(self.walk_to_rings(walk, origin, nodes))
+
+        # Keep order and starting point of rings the same as if they were
+        # discovered by following segments in their original order
+        rings.sort(key=lambda ring: min(ring) >> 1)
+        rings = [[origin[half_edge] for half_edge in self.orient_ring(ring)] for ring in rings]
+
+        if len(rings) == 0:
+            return []
+
+        # Shapely objects are only created for the found rings
+        closed = [ring + ring[:1] for ring in rings]
+        ring_ids = np.repeat(np.arange(len(closed)), [len(ring) for ring in closed])
+        candidates = shapely.polygons(shapely.linearrings(nodes[np.concatenate(closed)], indices=ring_ids))
+        valid = shapely.is_valid(candidates) & shapely.is_simple(candidates)
+
         polygons = []
         seen_polygons = set()
+        for ring, polygon, is_valid in zip(rings, candidates, valid):
+            if is_valid:
+                key = self.canonical_ring_key(ring)
+                if key not in seen_polygons:
+                    seen_polygons.add(key)
+                    polygons.append(polygon)
 
-        def dfs(path, used_edges):
-            """
-                Perform DFS algorithm to find neighboring lines.
-            """
+        return polygons
+
+    def orient_ring(self, ring):
+        """
+            INTERNAL FUNCTION!
 
-            current = self.round_point(path[-1])
-            for idx, neighbor in adj[current]:
-                if idx in used_edges:
-                    continue
+            Rotate (and reverse if needed) a ring of half-edges so it starts
+            with its lowest segment, walked from that segment's first point.
+        """
 
-                used_edges.add(idx)
-                path.append(neighbor)
+        first = min(range(len(ring)), key=lambda i: ring[i])
+        ring = ring[first:] + ring[:first]
 
-                if neighbor == path[0] and len(path) >= 4:
-                    ring = path[:]
-                    polygon = Polygon(ring)
+        if ring[0] & 1:
+            ring = [half_edge ^ 1 for half_edge in reversed(ring)]
+            ring = ring[-1:] + ring[:-1]
 
-                    if polygon.is_valid and polygon.is_simple:
-                        key = self.canonical_ring_key(ring)
-                        if key not in seen_polygons:
-                            seen_polygons.add(key)
-                            polygons.append(polygon)
+        return ring
 
-                elif neighbor not in path[:-1]:
-                    dfs(path, used_edges)
+    def least_rotation(self, sequence):
+        """
+            INTERNAL FUNCTION!
 
-                path.pop()
-                used_edges.remove(idx)
+            Get the index where the lexicographically smallest rotation of
+            a sequence starts, using Booth's algorithm.
+        """
 
-        for idx, line in enumerate(lines):
-            p1r = self.round_point(tuple(line.coords[0]))
-            p2r = self.round_point(tuple(line.coords[-1]))
-            dfs([p1r, p2r], {idx})
+        doubled = sequence + sequence
+        failure = [-1] * len(doubled)
+        k = 0
+
+        for j in range(1, len(doubled)):
+            item = doubled[j]
+            i = failure[j - k - 1]
+
+            while i != -1 and item != doubled[k + i + 1]:
+                if item < doubled[k + i + 1]:
+                    k = j - i - 1
+                i = failure[i]
+
+            if item != doubled[k + i + 1]:
+                # Here i == -1
+                if item < doubled[k]:
+                    k = j
+                failure[j - k] = -1
+
+            else:
+                failure[j - k] = i + 1
+
+        return k
 
-        return polygons
-    
     def linestrings_to_segments(self, lines):
         """
             INTERNAL FUNCTION!
 
-            Convert `LineString` objects into segments.
+            Convert `LineString` objects into an (N, 2, 2) array of segments.
         """
 
-        segments = []
-        for line in lines:
-            coords = list(line.coords)
-            for i in range(len(coords) - 1):
-                segments.append(LineString([coords[i], coords[i + 1]]))
+        coords, index = shapely.get_coordinates(lines, return_index=True)
+        consecutive = index[:-1] == index[1:]
 
-        return segments
-    
-    def round_point(self, pt):
+        return np.stack((coords[:-1][consecutive], coords[1:][consecutive]), axis=1)
+
+    def round_points(self, points):
         """
             INTERNAL FUNCTION!
 
-            Round a point.
+            Round an array of points.
         """
 
         precision = 6
-        return (round(pt[0], precision), round(pt[1], precision))
+
+        # Adding zero turns -0.0 into 0.0
+        return np.round(points, precision) + 0.0
+
+    def scanline_intervals(self, polygon, y_values):
+        """
+            INTERNAL FUNCTION!
+
+            Intersect a polygon with horizontal lines at sorted `y_values`.
+
+            Edges of all rings are loaded into arrays once and every edge is
+            matched only with the lines it spans, so crossings of all lines are
+            computed in one batch. Returns line indices and x-intervals, sorted
+            by line and then from left to right.
+        """
+
+        rings = [polygon.exterior, *polygon.interiors]
+        coords = [np.asarray(ring.coords)[:, :2] for ring in rings]
+
+        x0 = np.concatenate([c[:-1, 0] for c in coords])
+        y0 = np.concatenate([c[:-1, 1] for c in coords])
+        x1 = np.concatenate([c[1:, 0] for c in coords])
+        y1 = np.concatenate([c[1:, 1] for c in coords])
+
+        y_low = np.minimum(y0, y1)
+        y_high = np.maximum(y0, y1)
+
+        def crossings(side):
+            """
+                Pair crossings of edges spanning each line, a vertex lying
+                on a line counts as slightly below (`left`) or above it.
+            """
+
+            lo = np.searchsorted(y_values, y_low, side)
+            hi = np.searchsorted(y_values, y_high, side)
+            counts = hi - lo
+
+            edges = np.repeat(np.arange(len(x0)), counts)
+            rows = np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+            y = y_values[rows]
+            x = x0[edges] + (y - y0[edges]) * (x1[edges] - x0[edges]) / (y1[edges] - y0[edges])
+
+            order = np.lexsort((x, rows))
+            rows, x = rows[order], x[order]
+
+            return rows[0::2], x[0::2], x[1::2]
+
+        rows, x_start, x_end = crossings('left')
+
+        # Away from vertices both sides see the same crossings, on a vertex
+        # line the polygon is the union of what lies just above and below it
+        on_vertex = np.flatnonzero(np.isin(y_values, y0))
+        if len(on_vertex) > 0:
+            rows_below, start_below, end_below = crossings('right')
+
+            keep = ~np.isin(rows, on_vertex)
+            merged = [(rows[keep], x_start[keep], x_end[keep])]
+
+            for row in on_vertex:
+                intervals = sorted(
+                    list(zip(x_start[rows == row], x_end[rows == row])) +
+                    list(zip(start_below[rows_below == row], end_below[rows_below == row]))
+                )
+
+                union = []
+                for start, end in intervals:
+                    if len(union) > 0 and start <= union[-1][1]:
+                        union[-1][1] = max(union[-1][1], end)
+                    else:
+                        union.append([start, end])
+
+                union = np.array(union).reshape(-1, 2)
+                merged.append((np.full(len(union), row), union[:, 0], union[:, 1]))
+
+            rows = np.concatenate([m[0] for m in merged])
+            x_start = np.concatenate([m[1] for m in merged])
+            x_end = np.concatenate([m[2] for m in merged])
+
+            order = np.lexsort((x_start, rows))
+            rows, x_start, x_end = rows[order], x_start[order], x_end[order]
+
+        # Lines only touching the polygon in a point are not divisions
+        keep = x_end > x_start
+        return (rows[keep], x_start[keep], x_end[keep])
+
+    def snap_endpoints(self, segments):
+        """
+            INTERNAL FUNCTION!
+
+            Get rounded coordinates of all nodes and the (N, 2) array of node
+            indices at both ends of every segment. Endpoints closer than
+            `snap_tolerance` are moved onto the same node.
+
+            Close endpoints are found with a spatial index (O(n log n)) and
+            joined transitively, every cluster takes the position of its
+            first endpoint.
+        """
+
+        points = segments.reshape(-1, 2)
+
+        if self.snap_tolerance > 0 and len(points) > 0:
+            geometries = shapely.points(points)
+            tree = shapely.STRtree(geometries)
+            left, right = tree.query(geometries, predicate='dwithin',
+                                     distance=self.snap_tolerance)
+
+            # Propagate the lowest endpoint index through each cluster
+            labels = np.arange(len(points))
+            while True:
+                joined = labels.copy()
+                np.minimum.at(joined, left, labels[right])
+                joined = joined[joined]
+
+                if np.array_equal(joined, labels):
+                    break
+
+                labels = joined
+
+            points = points[labels]
+
+        nodes, endpoints = np.unique(self.round_points(points), axis=0, return_inverse=True)
+
+        return (nodes, endpoints.reshape(-1, 2))
+
+    def walk_to_rings(self, walk, origin, nodes):
+        """
+            INTERNAL FUNCTION!
+
+            Split a closed face walk into simple rings of half-edges.
+
+            Segments walked twice (dangling lines and bridges) are dropped and
+            the walk is cut wherever it revisits a node. Only counter-clockwise
+            rings bound a face, clockwise ones are holes or the outer face.
+        """
+
+        rings = []
+        path = []
+        position = {}
+
+        for half_edge in walk:
+            start = origin[half_edge]
+            end = origin[half_edge ^ 1]
+
+            # Walking straight back over the previous segment
+            if len(path) > 0 and path[-1] == half_edge ^ 1:
+                del position[end]
+                path.pop()
+                continue
+
+            position[start] = len(path)
+            path.append(half_edge)
+
+            if end in position:
+                ring = path[position[end]:]
+                del path[position[end]:]
+                for node in ring:
+                    del position[origin[node]]
+
+                x, y = nodes[[origin[node] for node in ring]].T
+                area = np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y)
+
+                if area > 0:
+                    rings.append(ring)
+
+        return rings
 
     ###########################################################################
     #####                                                                 #####
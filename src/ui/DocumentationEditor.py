@@ -359,7 +359,9 @@ class DEWindow(QWidget):
                 'grid_size': row[11],
                 'min_spacing': row[12]
             }
-        self.local_config.update(new_config)
+        # Keep options which are not shown in the editor
+        for section_name, values in new_config.items():
+            self.local_config.setdefault(section_name, {}).update(values)
         with open(self.config_path, 'w') as file:
             toml.dump(self.local_config, file)
         self.changed_config = False